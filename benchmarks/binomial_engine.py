@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+'''Compare the integer binomial engine with the sympy path it replaced.
+
+For each exponent, both paths expand (ax + b)^c and typeset everything a
+binomial expansion problem prints: the expanded polynomial and each term of
+the worked solution.  The outputs are checked against each other and the
+rate of each path is reported in problems/sec.
+
+    python benchmarks/binomial_engine.py [--exponents 2,5,9,20,50,100]
+'''
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'geckomodules'))
+
+import binomial_engine
+
+
+def engine_problem(a, b, c):
+    coeffs = binomial_engine.expand(a, b, c)
+    row = binomial_engine.pascal_row(c)
+    apowers = binomial_engine.powers(a, c)
+    bpowers = binomial_engine.powers(b, c)
+    texed = [binomial_engine.latex_poly([b, a]),
+             binomial_engine.latex_poly(coeffs)]
+    for k in xrange(c + 1):
+        texed.extend([str(row[k]), binomial_engine.latex_term(apowers[k], k),
+                      str(bpowers[c - k]),
+                      binomial_engine.latex_term(coeffs[k], k)])
+    return texed
+
+
+def sympy_problem(a, b, c):
+    import sympy
+    x = sympy.Symbol('x')
+
+    def latex(poly):
+        return sympy.latex(poly.as_expr())
+
+    poly = sympy.Poly((a * x + b)**c, x)
+    texed = [latex(sympy.Poly(a * x + b, x)), latex(poly)]
+    for k in xrange(c + 1):
+        texed.extend([sympy.latex(sympy.binomial(c, k)),
+                      latex(sympy.Poly((a * x)**k, x)),
+                      latex(sympy.Poly(b**(c - k), x)),
+                      latex(sympy.Poly(poly.nth(k) * x**k, x))])
+    return texed
+
+
+def rate(func, params, seconds):
+    '''Problems per second for `func` over `params`, for about `seconds`.'''
+    count = 0
+    start = time.time()
+    while True:
+        for a, b, c in params:
+            func(a, b, c)
+        count += len(params)
+        elapsed = time.time() - start
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-e', '--exponents', default='2,5,9,20,50,100',
+                        help='comma-separated exponents to benchmark')
+    parser.add_argument('-s', '--seconds', type=float, default=1.0,
+                        help='time to spend on each measurement')
+    args = parser.parse_args()
+
+    try:
+        import sympy
+    except ImportError:
+        sympy = None
+        print 'sympy is not installed; timing the engine only'
+
+    rng = random.Random(0)
+    nonzero = [value for value in xrange(-6, 6) if value]
+
+    print '{:>5} {:>16} {:>16} {:>9}'.format('c', 'engine (/sec)',
+                                            'sympy (/sec)', 'speedup')
+    for c in [int(exponent) for exponent in args.exponents.split(',')]:
+        params = [(rng.choice(nonzero), rng.choice(nonzero), c)
+                  for _ in xrange(20)]
+
+        engine_rate = rate(engine_problem, params, args.seconds)
+        if sympy is None:
+            print '{:>5} {:>16.1f}'.format(c, engine_rate)
+            continue
+
+        for a, b, _ in params:
+            if engine_problem(a, b, c) != sympy_problem(a, b, c):
+                print 'output differs from sympy for ({}x + {})^{}'.format(
+                    a, b, c)
+                return 1
+
+        sympy_rate = rate(sympy_problem, params, args.seconds)
+        print '{:>5} {:>16.1f} {:>16.1f} {:>8.1f}x'.format(
+            c, engine_rate, sympy_rate, engine_rate / sympy_rate)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+'''Measure problem generation throughput and worksheet latency.
+
+For every problem type in the plugin manifest, problems are drawn the way a
+worksheet draws them, and the script reports instances/sec and the p50 and
+p99 latency of drawing a problem (`init`) and of reading its `statement`,
+`answer` and `solution`.  It then times whole worksheets against the number
+of problems of each type: generating the TeX alone, and, when pdflatex is
+installed, compiling it too.
+
+The results are written as JSON, to the temp directory unless `--output`
+says otherwise, and compared against a stored baseline.  Any throughput,
+median latency or worksheet time that is worse than the baseline by more
+than the tolerance is reported, and the script exits with a non-zero
+status.
+
+    python benchmarks/generation.py [--count N] [--save-baseline]
+'''
+
+import argparse
+import distutils.spawn
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import geckomath
+import geckotex
+from geckomodules import plugins
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, 'generation_baseline.json')
+# outside the source tree, so a run doesn't leave a file to commit
+RESULTS = os.path.join(tempfile.gettempdir(), 'generation_results.json')
+
+FIELDS = ('statement', 'answer', 'solution')
+
+# Latencies shorter than this are too noisy to call a regression on.
+MIN_LATENCY = 1e-4
+
+
+class NullFile(object):
+    '''A file that throws away everything written to it.'''
+    softspace = 0
+
+    def write(self, text):
+        pass
+
+
+def percentile(values, fraction):
+    '''The value below which `fraction` of the sorted `values` lie.'''
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def type_benchmark(probtype, count, seed):
+    '''Throughput and per-field latencies for one problem type.'''
+    if probtype.space is not None:
+        count = min(count, probtype.space.size)
+
+    # get imports and problem banks out of the way before timing anything
+    for prob in probtype.draw_unique(1, 'warm-up'):
+        for field in FIELDS:
+            getattr(prob, field)
+
+    latencies = dict((name, []) for name in ('init',) + FIELDS)
+    problems = probtype.draw_unique(count, seed)
+    start = time.time()
+    while True:
+        before = time.time()
+        try:
+            prob = next(problems)
+        except StopIteration:
+            break
+        latencies['init'].append(time.time() - before)
+        for field in FIELDS:
+            before = time.time()
+            getattr(prob, field)
+            latencies[field].append(time.time() - before)
+    elapsed = time.time() - start
+
+    result = {'instances_per_sec': count / elapsed, 'latency': {}}
+    for name, values in latencies.items():
+        values.sort()
+        result['latency'][name] = {'p50': percentile(values, .5),
+                                   'p99': percentile(values, .99)}
+    return result
+
+
+def worksheet_benchmark(nprobs, seed, compiling):
+    '''Seconds to make a worksheet with `nprobs` problems of every type.'''
+    workdir = tempfile.mkdtemp(prefix='geckomath-bench-')
+    try:
+        config = geckomath.new_config(os.path.join(workdir, 'problems.pdf'),
+                                      os.path.join(workdir, 'solutions.pdf'),
+                                      nprobs=nprobs)
+        start = time.time()
+        if compiling:
+            geckomath.make_worksheet(config, config.get('output', 'problems'),
+                                     config.get('output', 'solutions'), seed)
+        else:
+            geckomath.write_to_files(NullFile(), NullFile(), config, seed)
+        return time.time() - start
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(args):
+    results = {
+        'python': platform.python_version(),
+        'pdflatex': None,
+        'types': {},
+        'worksheet': {'generate': {}},
+    }
+
+    print '{:<20} {:>12} {:>10} {:>10} {:>10} {:>10}'.format(
+        'type', 'inst/sec', 'init p99', 'stmt p99', 'ans p99', 'soln p99')
+    for probtype in [entry.load() for entry in plugins.probtypes()]:
+        result = type_benchmark(probtype, args.count, args.seed)
+        results['types'][probtype.__name__] = result
+        print '{:<20} {:>12.1f} {:>10.5f} {:>10.5f} {:>10.5f} {:>10.5f}'.format(
+            probtype.__name__, result['instances_per_sec'],
+            *[result['latency'][name]['p99'] for name in ('init',) + FIELDS])
+
+    compiling = (not args.no_compile
+                 and distutils.spawn.find_executable('pdflatex') is not None)
+    if compiling:
+        results['pdflatex'] = geckotex.engine_version()
+        results['worksheet']['compile'] = {}
+        # compile into an empty cache, so that every worksheet is compiled
+        cachedir = tempfile.mkdtemp(prefix='geckomath-bench-')
+        geckotex.pdf_cache = geckotex.PDFCache(directory=cachedir)
+        # build the preamble's format before anything is timed
+        geckotex.preamble_format(geckomath.DEFAULT_PREAMBLE)
+
+    print
+    print '{:>8} {:>12} {:>12}'.format('nprobs', 'generate', 'compile')
+    try:
+        for nprobs in args.nprobs:
+            generate = worksheet_benchmark(nprobs, args.seed, False)
+            results['worksheet']['generate'][str(nprobs)] = generate
+            line = '{:>8} {:>12.3f}'.format(nprobs, generate)
+            if compiling:
+                seconds = worksheet_benchmark(nprobs, args.seed, True)
+                results['worksheet']['compile'][str(nprobs)] = seconds
+                line += ' {:>12.3f}'.format(seconds)
+            print line
+    finally:
+        if compiling:
+            shutil.rmtree(cachedir, ignore_errors=True)
+
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    '''Describe every measurement that is worse than the baseline by more
+    than `tolerance`, as a fraction of the baseline.'''
+    found = []
+
+    for name, result in sorted(results['types'].items()):
+        base = baseline.get('types', {}).get(name)
+        if base is None:
+            continue
+        if (result['instances_per_sec']
+                < base['instances_per_sec'] * (1 - tolerance)):
+            found.append('{}: {:.1f} instances/sec, baseline {:.1f}'.format(
+                name, result['instances_per_sec'], base['instances_per_sec']))
+        # p99s are recorded, but they are too noisy to compare
+        for field, latency in sorted(result['latency'].items()):
+            now = latency['p50']
+            then = base['latency'].get(field, {}).get('p50')
+            if (then is not None and now > MIN_LATENCY
+                    and now > then * (1 + tolerance)):
+                found.append('{}.{} p50: {:.5f}s, baseline {:.5f}s'.format(
+                    name, field, now, then))
+
+    for mode, times in sorted(results['worksheet'].items()):
+        base = baseline.get('worksheet', {}).get(mode, {})
+        for nprobs, seconds in sorted(times.items(), key=lambda x: int(x[0])):
+            then = base.get(nprobs)
+            if then is not None and seconds > then * (1 + tolerance):
+                found.append('worksheet {} with {} of each: {:.3f}s, '
+                             'baseline {:.3f}s'.format(mode, nprobs, seconds,
+                                                       then))
+
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--count', type=int, default=200,
+                        help='problems to draw of each type (default: 200)')
+    parser.add_argument('-n', '--nprobs', type=int, nargs='+',
+                        default=[1, 5, 20],
+                        help='problems of each type per timed worksheet')
+    parser.add_argument('-s', '--seed', default='benchmark',
+                        help='worksheet seed to draw problems with')
+    parser.add_argument('--no-compile', action='store_true',
+                        help="don't time compiling, even with pdflatex")
+    parser.add_argument('-o', '--output', default=RESULTS,
+                        help='where to write the results (default: {})'
+                             .format(RESULTS))
+    parser.add_argument('-b', '--baseline', default=BASELINE,
+                        help='the baseline to compare against')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.5,
+                        help='allowed slowdown, as a fraction of the baseline '
+                             '(default: 0.5)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store these results as the new baseline')
+    args = parser.parse_args()
+
+    results = run(args)
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+    print
+    print 'results written to', args.output
+
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print 'baseline saved to', args.baseline
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print 'no baseline at', args.baseline
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    found = regressions(results, baseline, args.tolerance)
+    for regression in found:
+        print 'REGRESSION', regression
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+'''Measure how long it takes to import each geckomath module.
+
+Every module is imported in a fresh interpreter, several times over, and the
+fastest time is reported next to its budget from `import_budget.json`.  The
+script exits with a non-zero status if any module is over budget, so a
+problem module that starts importing something heavy at load time again is
+caught.
+
+    python benchmarks/import_time.py [--repeat N]
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      'import_budget.json')
+
+TIMER = '''
+import importlib, time
+start = time.time()
+importlib.import_module({module!r})
+print time.time() - start
+'''
+
+
+def import_time(module, repeat):
+    '''The fastest of `repeat` cold imports of `module`, in seconds.'''
+    times = []
+    for _ in xrange(repeat):
+        output = subprocess.check_output(
+            (sys.executable, '-c', TIMER.format(module=module)), cwd=ROOT)
+        times.append(float(output))
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='imports per module (default: 5)')
+    args = parser.parse_args()
+
+    with open(BUDGET) as budget_file:
+        budget = json.load(budget_file)
+
+    over = []
+    print '{:<36} {:>10} {:>10}'.format('module', 'seconds', 'budget')
+    for module in sorted(budget):
+        seconds = import_time(module, args.repeat)
+        flag = ''
+        if seconds > budget[module]:
+            over.append(module)
+            flag = '  OVER BUDGET'
+        print '{:<36} {:>10.4f} {:>10.4f}{}'.format(module, seconds,
+                                                    budget[module], flag)
+
+    return 1 if over else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
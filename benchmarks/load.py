@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+'''Load a running geckoserver.py and report throughput and tail latency.
+
+`--concurrency` clients send worksheet requests back to back until
+`--requests` have been sent, and the script reports requests/sec and the
+p50, p90, p99 and maximum latency of the successful ones.  Requests the
+server turns away with 503 are counted, not retried.
+
+    python geckoserver.py --jobs 4 &
+    python benchmarks/load.py [--requests 200] [--concurrency 8] [--pdf]
+'''
+
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib2
+
+
+def percentile(values, fraction):
+    '''The value below which `fraction` of the sorted `values` lie.'''
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def client(url, body, counter, latencies, statuses, lock):
+    '''Send requests until `counter` runs out.'''
+    request = urllib2.Request(url, body,
+                              {'Content-Type': 'application/json'})
+    for _ in counter:
+        start = time.time()
+        try:
+            response = urllib2.urlopen(request)
+            response.read()
+            status = response.getcode()
+        except urllib2.HTTPError as error:
+            error.read()
+            status = error.code
+        except urllib2.URLError as error:
+            status = str(error.reason)
+        elapsed = time.time() - start
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-u', '--url', default='http://127.0.0.1:8000',
+                        help='the server (default: http://127.0.0.1:8000)')
+    parser.add_argument('-r', '--requests', type=int, default=200,
+                        help='requests to send (default: 200)')
+    parser.add_argument('-c', '--concurrency', type=int, default=8,
+                        help='requests in flight at once (default: 8)')
+    parser.add_argument('-n', '--nprobs', type=int, default=2,
+                        help='problems of each type per worksheet')
+    parser.add_argument('-t', '--types', nargs='+',
+                        default=['AbsValProb', 'BinomExpProb', 'TwoVarProb'],
+                        help='problem types to put on each worksheet')
+    parser.add_argument('--pdf', action='store_true',
+                        help='ask for compiled PDFs rather than TeX')
+    args = parser.parse_args()
+
+    spec = dict((name, {'nprobs': args.nprobs, 'solutions': True})
+                for name in args.types)
+    url = '{}/worksheet?format={}'.format(args.url.rstrip('/'),
+                                          'pdf' if args.pdf else 'tex')
+    # xrange iterators aren't safe to share between threads, so guard one
+    # with a lock the clients pull from
+    counter_lock = threading.Lock()
+    numbers = iter(xrange(args.requests))
+
+    def counter():
+        while True:
+            with counter_lock:
+                number = next(numbers, None)
+            if number is None:
+                return
+            yield number
+
+    latencies, statuses, lock = [], {}, threading.Lock()
+    threads = [threading.Thread(target=client,
+                                args=(url, json.dumps(spec), counter(),
+                                      latencies, statuses, lock))
+               for _ in xrange(args.concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    for status, count in sorted(statuses.items()):
+        print '{:>6} {}'.format(count, status)
+    if not latencies:
+        print 'no request succeeded'
+        return 1
+
+    latencies.sort()
+    print
+    print '{:<14} {:>10.1f}'.format('requests/sec', len(latencies) / elapsed)
+    for name, fraction in (('p50', .5), ('p90', .9), ('p99', .99)):
+        print '{:<14} {:>10.4f}'.format(name + ' seconds',
+                                        percentile(latencies, fraction))
+    print '{:<14} {:>10.4f}'.format('max seconds', latencies[-1])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+'''Measure the size and speed of problem records.
+
+For every problem type in the plugin manifest, `--count` records are drawn
+the way a worksheet draws them, and the script reports records drawn per
+second, the bytes each record takes in memory and pickled, and problems
+rendered per second from the records.
+
+    python benchmarks/records.py [--count N]
+'''
+
+import argparse
+import cPickle as pickle
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from geckomodules import plugins
+
+FIELDS = ('statement', 'answer', 'solution')
+
+
+def deep_size(value):
+    '''The bytes taken by `value` and the tuples it holds.  Small ints and
+    strings are shared between records, so they are counted once each.'''
+    size = sys.getsizeof(value)
+    if isinstance(value, tuple):
+        size += sum(deep_size(item) for item in value
+                    if isinstance(item, tuple))
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count', type=int, default=1000,
+                        help='records of each type to draw (default: 1000)')
+    args = parser.parse_args()
+
+    print '{:<20} {:>10} {:>10} {:>10} {:>10}'.format(
+        'type', 'records/s', 'bytes', 'pickled', 'renders/s')
+    for entry in plugins.probtypes():
+        probtype = entry.load()
+        count = args.count
+        if probtype.space is not None:
+            count = min(count, probtype.space.size)
+        # get imports and problem banks out of the way before timing
+        for prob in probtype.draw_unique(1, 'warm-up'):
+            for field in FIELDS:
+                getattr(prob, field)
+
+        start = time.time()
+        records = list(probtype.draw_records(count, 'records'))
+        drawing = time.time() - start
+        size = sum(deep_size(record) for record in records) / float(count)
+        pickled = len(pickle.dumps(records, 2)) / float(count)
+
+        rendered = records[:min(count, 200)]
+        start = time.time()
+        for prob in probtype.render(rendered):
+            for field in FIELDS:
+                getattr(prob, field)
+        rendering = time.time() - start
+
+        print '{:<20} {:>10.0f} {:>10.1f} {:>10.1f} {:>10.0f}'.format(
+            entry.name, count / drawing, size, pickled,
+            len(rendered) / rendering)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+'''Measure the throughput of the parameter samplers.
+
+Each sampler draws `--count` parameter sets of the shape a problem type
+uses, and the rate is reported in parameter sets/sec.  Every draw is also
+checked against the constraints it is supposed to satisfy.
+
+    python benchmarks/sampling.py [--count 1000000]
+'''
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'geckomodules'))
+
+import sampling
+from probability import ConditionalProb
+
+
+def samplers():
+    '''(name, draw, check) for each kind of parameter set.'''
+    space = ConditionalProb.space
+    return [
+        ('split of 100 into 4',
+         lambda rng: sampling.composition(rng, 100, 4, minimum=1),
+         lambda parts: sum(parts) == 100 and min(parts) >= 1),
+        ('split of 100000 into 4',
+         lambda rng: sampling.composition(rng, 100000, 4, minimum=1),
+         lambda parts: sum(parts) == 100000 and min(parts) >= 1),
+        ('urn of at most 20',
+         lambda rng: sampling.bounded_composition(rng, 20, 2, minimum=1),
+         lambda parts: sum(parts) <= 20 and min(parts) >= 1),
+        ('risk factor percentages',
+         lambda rng: space.params(space.key(rng.randrange(space.size))),
+         lambda p: (0 < p['single'] < p['double'] and 0 < p['triple']
+                    and 3*p['single'] + 3*p['double'] + p['triple'] < 100)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--count', type=int, default=1000000,
+                        help='parameter sets to draw per sampler')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='seed for the random generator')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print '{:<28} {:>12} {:>10} {:>14}'.format('sampler', 'draws', 'seconds',
+                                               'sets/sec')
+    for name, draw, check in samplers():
+        start = time.time()
+        draws = [draw(rng) for _ in xrange(args.count)]
+        elapsed = time.time() - start
+
+        bad = [params for params in draws if not check(params)]
+        if bad:
+            print '{}: {} draws break the constraints, e.g. {}'.format(
+                name, len(bad), bad[0])
+            return 1
+
+        print '{:<28} {:>12} {:>10.2f} {:>14.0f}'.format(
+            name, args.count, elapsed, args.count / elapsed)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+'''Measure how long a batch worker takes to make its first problems.
+
+Every worker is given the same task, generating and rendering one problem
+of each type, and the script reports how long after the workers were
+started the first of them, and the last of them, finished it.  Workers are
+started three ways:
+
+* `spawn`: a fresh interpreter each, as multiprocessing does on Windows
+* `fork`: a `multiprocessing.Pool` forked from a parent that has only
+  imported geckomath, as batch workers were before
+* `warm fork`: `workers.warm_pool`, which generates a problem of each type
+  in the parent before forking; the parent's warm-up is reported on its own
+
+    python benchmarks/startup.py [--jobs N] [--repeat N] [--types TYPE ...]
+'''
+
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# imported the way a batch parent, or a spawned worker, has it imported
+import geckomath
+from geckomodules import plugins, workers
+
+
+def first_problems(names):
+    '''Worker task: one problem of each of the types `names`; returns the
+    time it finished.'''
+    for entry in plugins.probtypes():
+        if entry.name in names:
+            for prob in entry.load().draw_unique(1, os.getpid()):
+                prob.statement, prob.answer, prob.solution
+    return time.time()
+
+
+def spawned(names, jobs):
+    '''Finish times of `jobs` fresh interpreters, and when they started.'''
+    start = time.time()
+    children = [subprocess.Popen((sys.executable, __file__, '--child')
+                                 + tuple(names), stdout=subprocess.PIPE)
+                for _ in xrange(jobs)]
+    return start, [float(child.communicate()[0]) for child in children]
+
+
+def forked(names, jobs, make_pool):
+    '''Finish times of the `jobs` workers of a pool from `make_pool`, and
+    when it was made.'''
+    start = time.time()
+    pool = make_pool(jobs)
+    try:
+        results = [pool.apply_async(first_problems, (names,))
+                   for _ in xrange(jobs)]
+        return start, [result.get() for result in results]
+    finally:
+        pool.close()
+        pool.join()
+
+
+def report(mode, runs):
+    '''Print the fastest `runs` of `mode`.'''
+    first = min(min(done) - start for start, done in runs)
+    last = min(max(done) - start for start, done in runs)
+    print '{:<16} {:>10.4f} {:>10.4f}'.format(mode, first, last)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-j', '--jobs', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='workers to start (default: one per core)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='runs of each mode (default: 3)')
+    parser.add_argument('-t', '--types', nargs='+',
+                        default=[entry.name for entry in plugins.probtypes()],
+                        help='problem types each worker makes (default: all)')
+    parser.add_argument('--child', nargs='*', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print first_problems(args.child)
+        return 0
+
+    entries = [entry for entry in plugins.probtypes()
+               if entry.name in args.types]
+    # an untimed run builds any missing problem banks and gets the files
+    # into the page cache, so no mode pays for that
+    spawned(args.types, 1)
+
+    print '{:<16} {:>10} {:>10}'.format('seconds', 'first',
+                                        'all {}'.format(args.jobs))
+    report('spawn', [spawned(args.types, args.jobs)
+                     for _ in xrange(args.repeat)])
+    # the cold forks have to come before anything warms up this process
+    report('fork', [forked(args.types, args.jobs, multiprocessing.Pool)
+                    for _ in xrange(args.repeat)])
+    warm_up = workers.warm_up(entries)
+    report('warm fork', [
+        forked(args.types, args.jobs,
+               lambda jobs: workers.warm_pool(jobs, entries))
+        for _ in xrange(args.repeat)])
+    print '{:<16} {:>10.4f}'.format('parent warm-up', warm_up)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,7 +9,6 @@ configuration values and run the program.
 
 # stdlib modules
 import argparse
-import ConfigParser
 import logging
 import os
 
@@ -18,7 +17,7 @@ import wx
 from wx.lib.mixins.inspection import InspectionMixin
 
 # geckomath modules
-from geckomodules import *
+from geckomodules import plugins, pool
 import geckomath
 
 logging.basicConfig(
@@ -40,7 +39,10 @@ class ConfigFrame(wx.Frame):
                           wx.DefaultPosition, ((774 - 284), 553))
 
         self.to_file = to_file
+        self.job = None
+        self.problem_pool = None if to_file else pool.ProblemPool()
         self.build_menu()
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
 
         self.scroll = wx.ScrolledWindow(self, -1)
         panel = wx.Panel(self.scroll, -1)
@@ -58,23 +60,42 @@ class ConfigFrame(wx.Frame):
         sizer.Add(self.solution_output, (1, 0), flag=wx.EXPAND)
 
         sizer_index = 2
-        probtypes = Problems.PROBTYPES
+        # the panels come from the plugin manifest, so no problem module is
+        # imported until its problems are needed
+        probtypes = plugins.probtypes()
         probtypes.sort(key=lambda x: x.secname)
-        for probtype in Problems.PROBTYPES:
-            logging.debug('adding problem type {}'.format(probtype.__name__))
+        for probtype in probtypes:
+            logging.debug('adding problem type {}'.format(probtype.name))
             prob_panel = ProbPanel(panel, probtype.secname)
-            self.prob_panels[probtype.__name__] = prob_panel
+            self.prob_panels[probtype.name] = prob_panel
             sizer.Add(prob_panel, (sizer_index, 0))
             sizer_index += 1
 
+            if self.problem_pool is not None:
+                # keep the pool in step with the panel
+                resize = (lambda event, probtype=probtype:
+                          self.configure_pool(probtype))
+                prob_panel.counter.Bind(wx.EVT_SPINCTRL, resize)
+                prob_panel.depth.Bind(wx.EVT_CHOICE, resize)
+                self.configure_pool(probtype)
+
+        if self.problem_pool is not None:
+            self.problem_pool.start()
+
         if self.to_file:
             label = 'Write to file'
         else:
             label = 'Generate PDFs'
 
-        save_button = wx.Button(panel, id=-1, label=label)
-        save_button.Bind(wx.EVT_BUTTON, self.write_to_file)
-        sizer.Add(save_button, (sizer_index, 0), flag=wx.EXPAND)
+        self.save_button = wx.Button(panel, id=-1, label=label)
+        self.save_button.Bind(wx.EVT_BUTTON, self.write_to_file)
+        sizer.Add(self.save_button, (sizer_index, 0), flag=wx.EXPAND)
+        sizer_index += 1
+
+        if not self.to_file:
+            self.progress = ProgressPanel(panel)
+            self.progress.cancel_button.Bind(wx.EVT_BUTTON, self.OnCancel)
+            sizer.Add(self.progress, (sizer_index, 0), flag=wx.EXPAND)
 
         panel.SetSizerAndFit(sizer)
 
@@ -124,8 +145,27 @@ class ConfigFrame(wx.Frame):
         self.SetMenuBar(menu_bar)
 
     def OnQuit(self, event):
+        self.Close()
+
+    def OnClose(self, event):
+        if self.job is not None:
+            self.job.cancel()
+        if self.problem_pool is not None:
+            self.problem_pool.stop()
         self.Destroy()
 
+    def configure_pool(self, probtype):
+        '''Size the pool of ready-made problems from the type's panel.'''
+        prob_panel = self.prob_panels[probtype.name]
+        self.problem_pool.configure(probtype, prob_panel.counter.GetValue(),
+                                    bool(prob_panel.depth.GetSelection()))
+
+    def OnCancel(self, event):
+        if self.job is not None:
+            self.job.cancel()
+            self.progress.status.SetLabel('Cancelling...')
+            self.progress.cancel_button.Disable()
+
     def OnAbout(self, event):
         dlg = wx.MessageDialog(self, "This is a small program to test\n"
                                      "the use of menus on Mac, etc.\n",
@@ -164,37 +204,58 @@ class ConfigFrame(wx.Frame):
     def write_to_file(self, event):
         '''Build a config object, pass it to geckomath.main().'''
         logging.debug("Writing to file")
-        config = ConfigParser.ConfigParser()
-
-        config.add_section('output')
-        config.set('output', 'problems', self.problem_output.path)
-        config.set('output', 'solutions', self.solution_output.path)
+        config = geckomath.new_config(self.problem_output.path,
+                                      self.solution_output.path)
 
         for section, params in self.prob_panels.items():
-            config.add_section(section)
             config.set(section, 'nprobs', str(params.counter.GetValue()))
             depth = str(bool(params.depth.GetSelection()))
             logging.debug('{section} Depth: {depth}'.format(section=section,
                                                             depth=depth))
             config.set(section, 'solutions', depth)
 
-        config.add_section('LaTeX')
-        config.set('LaTeX', 'preamble',
-            r'''\documentclass[11pt,notitlepage,letterpaper,oneside]{article}
-                \usepackage{amsmath}
-                \newcommand{\abs}[1]{\left\lvert{#1}\right\rvert}
-                \begin{document}''')
-        config.set('LaTeX', 'postamble',
-            r'\end{document}')
-
         if self.to_file:
             logging.debug('writing to geckomath.ini')
             with open('geckomath.ini', 'wb') as configfile:
                 config.write(configfile)
 
         else:
-            logging.debug('calling geckomath.main')
-            geckomath.main(config)
+            logging.debug('starting a worksheet job')
+            self.save_button.Disable()
+            self.progress.start()
+            # leave the processor to the job; the pool refills afterwards
+            self.problem_pool.pause()
+            self.job = geckomath.WorksheetJob(
+                config, self.problem_output.path, self.solution_output.path,
+                progress=lambda *step: wx.CallAfter(self.on_progress, *step),
+                finished=lambda error: wx.CallAfter(self.on_finished, error),
+                pool=self.problem_pool)
+            self.job.start()
+
+    def on_progress(self, done, total, step):
+        '''Show how far the worksheet job has got.'''
+        if self:
+            self.progress.update(done, total, step)
+
+    def on_finished(self, error):
+        '''Report the end of the worksheet job and allow another.'''
+        if not self:
+            # the window was closed while the job was running
+            return
+        self.job = None
+        self.save_button.Enable()
+        self.problem_pool.resume()
+        if error is None:
+            self.progress.finish('Done')
+        elif isinstance(error, geckomath.CompileCancelled):
+            self.progress.finish('Cancelled')
+        else:
+            self.progress.finish('Failed')
+            dlg = wx.MessageDialog(self, 'Making the worksheet failed:\n'
+                                         '{}'.format(error),
+                                   'Error', wx.OK | wx.ICON_ERROR)
+            dlg.ShowModal()
+            dlg.Destroy()
 
 
 class OutputPanel(wx.Panel):
@@ -245,6 +306,39 @@ class OutputPanel(wx.Panel):
         dlg.Destroy()
 
 
+class ProgressPanel(wx.Panel):
+    '''Progress of the worksheet being made, with a button to cancel it.'''
+    def __init__(self, parent):
+        wx.Panel.__init__(self, parent, -1)
+        sizer = wx.GridBagSizer(4, 4)
+
+        self.gauge = wx.Gauge(self, -1, range=1, size=(400, 20))
+        sizer.Add(self.gauge, (0, 0), flag=wx.EXPAND)
+
+        self.cancel_button = wx.Button(self, label='Cancel')
+        self.cancel_button.Disable()
+        sizer.Add(self.cancel_button, (0, 1), flag=wx.RIGHT)
+
+        self.status = wx.StaticText(self, -1, '')
+        sizer.Add(self.status, (1, 0), span=(1, 2), flag=wx.EXPAND)
+
+        self.SetSizerAndFit(sizer)
+
+    def start(self):
+        self.gauge.SetValue(0)
+        self.status.SetLabel('Generating...')
+        self.cancel_button.Enable()
+
+    def update(self, done, total, step):
+        self.gauge.SetRange(total)
+        self.gauge.SetValue(done)
+        self.status.SetLabel(step)
+
+    def finish(self, status):
+        self.status.SetLabel(status)
+        self.cancel_button.Disable()
+
+
 class ProbPanel(wx.Panel):
     '''The configuration panel for a particular problem type.'''
     def __init__(self, parent, name):
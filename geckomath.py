@@ -1,56 +1,751 @@
+import argparse
+import collections
 import ConfigParser
+import csv
+import datetime
+import hashlib
+import heapq
+import itertools
+import json
 import logging
+import multiprocessing
 import os
+import random
+import re
+import shutil
 import StringIO
 import subprocess
+import sys
+import tempfile
+import threading
+import time
 
-from geckomodules import *
+from geckomodules import Problems, bank, instrumentation, plugins, workers
+import geckotex
 
+DEFAULT_PREAMBLE = r'''\documentclass[11pt,notitlepage,letterpaper,oneside]{article}
+                \usepackage{amsmath}
+                \newcommand{\abs}[1]{\left\lvert{#1}\right\rvert}
+                \begin{document}'''
+DEFAULT_POSTAMBLE = r'\end{document}'
 
-def write_to_files(probtex, solntex, config):
-    '''Print TeX to files'''
+
+def new_config(prob_path, soln_path, nprobs=0, solutions=True):
+    '''A config with the default preamble that asks for `nprobs` problems of
+    every type.'''
+    config = ConfigParser.ConfigParser()
+
+    config.add_section('output')
+    config.set('output', 'problems', prob_path)
+    config.set('output', 'solutions', soln_path)
+
+    for probtype in plugins.probtypes():
+        config.add_section(probtype.name)
+        config.set(probtype.name, 'nprobs', str(nprobs))
+        config.set(probtype.name, 'solutions', str(solutions))
+
+    config.add_section('LaTeX')
+    config.set('LaTeX', 'preamble', DEFAULT_PREAMBLE)
+    config.set('LaTeX', 'postamble', DEFAULT_POSTAMBLE)
+    return config
+
+
+def fragment_key(probtype, nprobs, solutions, seed):
+    '''The key of one section's TeX in a `geckotex.FragmentCache`: the
+    section's settings, the worksheet seed and the problem type's source.'''
+    version = bank.bank_version(probtype, {})
+    return hashlib.sha1('\0'.join([version, str(nprobs), str(solutions),
+                                    str(seed)])).hexdigest()
+
+
+def write_section(probtex, solntex, entry, nprobs, solutions, seed=None,
+                  fragments=None, pool=None):
+    '''Print the section of the problem type `entry` (a `plugins.ProbType`),
+    from the `fragments` cache if it has been written with the same
+    settings and seed before, or with problems taken from a
+    `pool.ProblemPool`.  The type's module is only imported if the section
+    has problems.'''
+    if not nprobs:
+        return
+    probtype = entry.load()
+    if pool is not None:
+        probtype.write_probs(probtex, solntex, nprobs, solutions,
+                             problems=pool.take(entry, nprobs, solutions))
+        return
+    if fragments is None or seed is None:
+        probtype.write_probs(probtex, solntex, nprobs, solutions, seed)
+        return
+
+    key = fragment_key(probtype, nprobs, solutions, seed)
+    fragment = fragments.fetch(key)
+    if fragment is None:
+        logging.debug('%s: writing the section', probtype.__name__)
+        fragment = StringIO.StringIO(), StringIO.StringIO()
+        probtype.write_probs(fragment[0], fragment[1], nprobs, solutions,
+                             seed)
+        fragment = fragment[0].getvalue(), fragment[1].getvalue()
+        fragments.store(key, *fragment)
+    else:
+        logging.debug('%s: reusing the cached section', probtype.__name__)
+    probtex.write(fragment[0])
+    solntex.write(fragment[1])
+
+
+def write_to_files(probtex, solntex, config, seed=None, fragments=None,
+                   progress=None, pool=None):
+    '''Print TeX to files
+
+    With a worksheet `seed`, every problem is drawn from its own generator
+    seeded from it, so the same seed always gives the same worksheet.  Each
+    section then only depends on its own settings and the seed, so given a
+    `geckotex.FragmentCache` as `fragments`, sections that haven't changed
+    since they were last written are copied from it.  With a
+    `pool.ProblemPool` as `pool`, the problems are taken from it instead,
+    and the seed isn't used.
+
+    `progress` is called with 'section' and the section's name after each
+    section with problems in it is written.
+    '''
     print >>probtex, config.get('LaTeX', 'preamble')
     print >>solntex, config.get('LaTeX', 'preamble')
 
-    for probtype in Problems.PROBTYPES:
+    for probtype in plugins.probtypes():
+
+        nprobs = config.getint(probtype.name, 'nprobs')
+        solutions = config.getboolean(probtype.name, 'solutions')
+        write_section(probtex, solntex, probtype, nprobs, solutions, seed,
+                      fragments, pool)
+        if progress is not None and nprobs:
+            progress('section', probtype.secname)
 
-        nprobs = config.getint(probtype.__name__, 'nprobs')
-        solutions = config.getboolean(probtype.__name__, 'solutions')
-        probtype.write_probs(probtex, solntex, nprobs, solutions)
+    logging.debug('derived fields: %d computed, %d recomputations avoided',
+                  sum(Problems.DERIVED_COMPUTED.values()),
+                  sum(Problems.DERIVED_REUSED.values()))
 
     print >>probtex, config.get('LaTeX', 'postamble')
     print >>solntex, config.get('LaTeX', 'postamble')
 
 
-def compile_to_TeX(ptex, stex, prob_path, soln_path):
-    '''Compile the given TeX files and clean up'''
-    logging.debug("compiling the TeX files")
+def _pdflatex_command(jobname, fmt=None):
+    '''The pdflatex command line and environment for a job.'''
+    command = ['pdflatex', '-jobname', jobname]
+    env = None
+    if fmt is not None:
+        command.append('-fmt={}'.format(fmt.name))
+        env = fmt.env
+    return command, env
+
+
+def _run_pdflatex(tex, jobdir, jobname, fmt=None, watch=None):
+    '''Run pdflatex once in `jobdir`; return the path of the PDF it made.
 
-    latex_call = subprocess.Popen(('pdflatex',),
+    If given, `watch` is called with the pdflatex process once it starts.
+    '''
+    command, env = _pdflatex_command(jobname, fmt)
+    start = time.time()
+    latex_call = subprocess.Popen(command,
                                   stdin=subprocess.PIPE,
-                                  stdout=subprocess.PIPE)
+                                  stdout=subprocess.PIPE,
+                                  cwd=jobdir, env=env)
+    if watch is not None:
+        watch(latex_call)
 
-    texout, texerr = latex_call.communicate(ptex.getvalue())
+    texout, texerr = latex_call.communicate(tex)
 
-    logging.debug('texout: \n %s', texout)
-    logging.debug('texerr: \n %s', texerr)
-    
-    os.rename('texput.pdf', prob_path)
+    logging.debug('%s texout: \n %s', jobname, texout)
+    logging.debug('%s texerr: \n %s', jobname, texerr)
 
+    pdf = os.path.join(jobdir, jobname + '.pdf')
+    _emit_pdflatex(jobname, 'batch', fmt, time.time() - start,
+                   latex_call.returncode, pdf, len(texout))
+    return pdf
 
-    latex_call = subprocess.Popen(('pdflatex',),
-                                  stdin=subprocess.PIPE,
-                                  stdout=subprocess.PIPE)
 
-    texout, texerr = latex_call.communicate(stex.getvalue())
+def _emit_pdflatex(jobname, mode, fmt, seconds, status, pdf, log_bytes):
+    '''Emit the instrumentation event for one pdflatex run.'''
+    if not instrumentation.enabled():
+        return
+    pdf_bytes = os.path.getsize(pdf) if os.path.exists(pdf) else None
+    instrumentation.emit('pdflatex', job=jobname, mode=mode,
+                         format=fmt.name if fmt is not None else None,
+                         seconds=seconds, status=status, pdf_bytes=pdf_bytes,
+                         log_bytes=log_bytes)
+
+
+def compile_job(tex, pdf_path, preamble=None, cache=None, watch=None):
+    '''Run pdflatex on the TeX source in a private job directory.
+
+    Every job gets its own temporary directory and a unique jobname, so any
+    number of compiles can run side by side without clobbering each other's
+    output.  If the `preamble` the source starts with is given, it is loaded
+    from a precompiled format instead of being parsed again.  The finished
+    PDF is moved to `pdf_path`.  If a `geckotex.PDFCache` is given, a PDF
+    already compiled from the same source is copied from it instead.
+    `watch` is called with every pdflatex process the job starts.
+    '''
+    if cache is not None:
+        key = cache.key(tex)
+        if cache.fetch(key, pdf_path):
+            logging.debug('%s served from the PDF cache', pdf_path)
+            instrumentation.emit('pdf_cache_hit', path=pdf_path)
+            return
+
+    fmt = geckotex.preamble_format(preamble) if preamble else None
+    if fmt is not None and not tex.startswith(fmt.head):
+        fmt = None
+
+    jobdir = tempfile.mkdtemp(prefix='geckomath-')
+    jobname = os.path.basename(jobdir)
+    try:
+        if fmt is not None:
+            pdf = _run_pdflatex(tex[len(fmt.head):], jobdir, jobname, fmt,
+                                watch)
+            if not os.path.exists(pdf):
+                logging.warning('compiling with format %s failed, '
+                                'falling back to the full preamble', fmt.name)
+                pdf = _run_pdflatex(tex, jobdir, jobname, watch=watch)
+        else:
+            pdf = _run_pdflatex(tex, jobdir, jobname, watch=watch)
+
+        shutil.move(pdf, pdf_path)
+    finally:
+        shutil.rmtree(jobdir, ignore_errors=True)
+
+    if cache is not None:
+        cache.store(key, pdf_path)
+
+
+class CompileStream(object):
+    '''A file-like object that feeds pdflatex while it is being written.
+
+    pdflatex is started as soon as the beginning of the document arrives and
+    typesets while the rest is still being generated, so nothing holds the
+    whole document in memory.  The source is also spooled to the job
+    directory, so that a compile with a precompiled format can be redone
+    with the full preamble if it fails.  Once the document is complete,
+    `close()` waits for pdflatex and moves the PDF to `pdf_path`; if the
+    `cache` already holds a PDF for the same source, pdflatex is stopped
+    and the cached PDF is used instead.
+    '''
+
+    def __init__(self, pdf_path, preamble=None, cache=None):
+        self.pdf_path = pdf_path
+        self.cache = cache
+        self.softspace = 0
+
+        self._fmt = geckotex.preamble_format(preamble) if preamble else None
+        self._hasher = (cache or geckotex.PDFCache).hasher()
+        self._pending = ''
+        self._latex = None
+        self._broken = False
+        self._cancelled = False
+
+        self.jobdir = tempfile.mkdtemp(prefix='geckomath-')
+        self.jobname = os.path.basename(self.jobdir)
+        self._spool = open(os.path.join(self.jobdir, 'source.tex'), 'wb')
+        self._texout = open(os.path.join(self.jobdir, 'texout.txt'), 'w+')
+
+    def write(self, data):
+        self._hasher.update(data)
+        self._spool.write(data)
+
+        if self._latex is None:
+            # hold on to the start of the document until we know whether it
+            # begins with the preamble that is in the format
+            self._pending += data
+            head = self._fmt.head if self._fmt is not None else ''
+            if (len(self._pending) < len(head)
+                    and head.startswith(self._pending)):
+                return
+            self._start()
+        else:
+            self._feed(data)
+
+    def _start(self):
+        fmt = self._fmt
+        if fmt is not None and not self._pending.startswith(fmt.head):
+            fmt = None
+        self._fmt = fmt
+
+        command, env = _pdflatex_command(self.jobname, fmt)
+        self._started = time.time()
+        self._latex = subprocess.Popen(command, bufsize=-1,
+                                       stdin=subprocess.PIPE,
+                                       stdout=self._texout,
+                                       stderr=subprocess.STDOUT,
+                                       cwd=self.jobdir, env=env)
+        data = self._pending[len(fmt.head):] if fmt else self._pending
+        self._pending = ''
+        self._feed(data)
+
+    def _feed(self, data):
+        if self._broken:
+            return
+        try:
+            self._latex.stdin.write(data)
+        except IOError:
+            # pdflatex gave up early; close() will sort it out
+            self._broken = True
+
+    def close(self):
+        '''Finish the document and produce the PDF.
+
+        Raises `CompileCancelled` if `cancel()` was called.
+        '''
+        if self._cancelled:
+            self.abort()
+            raise CompileCancelled(self.pdf_path)
+        if self._latex is None:
+            self._start()
+        self._spool.close()
+        try:
+            self._latex.stdin.close()
+        except IOError:
+            pass
+
+        try:
+            key = self._hasher.hexdigest()
+            if self.cache is not None and self.cache.fetch(key,
+                                                           self.pdf_path):
+                logging.debug('%s served from the PDF cache', self.pdf_path)
+                instrumentation.emit('pdf_cache_hit', path=self.pdf_path)
+                self._stop()
+                return
+
+            self._latex.wait()
+            if self._cancelled:
+                raise CompileCancelled(self.pdf_path)
+            self._texout.seek(0)
+            texout = self._texout.read()
+            logging.debug('%s texout: \n %s', self.jobname, texout)
+
+            pdf = os.path.join(self.jobdir, self.jobname + '.pdf')
+            _emit_pdflatex(self.jobname, 'stream', self._fmt,
+                           time.time() - self._started,
+                           self._latex.returncode, pdf, len(texout))
+            if not os.path.exists(pdf) and self._fmt is not None:
+                logging.warning('compiling with format %s failed, '
+                                'falling back to the full preamble',
+                                self._fmt.name)
+                with open(self._spool.name, 'rb') as spool:
+                    pdf = _run_pdflatex(spool.read(), self.jobdir,
+                                        self.jobname)
+
+            shutil.move(pdf, self.pdf_path)
+        finally:
+            self._cleanup()
+
+        if self.cache is not None:
+            self.cache.store(key, self.pdf_path)
+
+    def cancel(self):
+        '''Stop pdflatex from another thread; `close()` then gives up.'''
+        self._cancelled = True
+        self._stop()
+
+    def abort(self):
+        '''Throw the document away and stop pdflatex.'''
+        self._spool.close()
+        self._stop()
+        self._cleanup()
+
+    def _stop(self):
+        if self._latex is not None and self._latex.poll() is None:
+            self._latex.kill()
+            self._latex.wait()
+
+    def _cleanup(self):
+        self._texout.close()
+        shutil.rmtree(self.jobdir, ignore_errors=True)
+
+
+def compile_mix(config, document):
+    '''A name for the problem mix in the 'problems' or 'solutions'
+    `document` of a worksheet, to remember its compile time under.'''
+    parts = [document]
+    for probtype in plugins.probtypes():
+        name = probtype.name
+        nprobs = config.getint(name, 'nprobs')
+        if nprobs:
+            if (document == 'solutions'
+                    and config.getboolean(name, 'solutions')):
+                name += '+solutions'
+            parts.append('{}={}'.format(name, nprobs))
+    return ' '.join(parts)
+
+
+class CompileCancelled(Exception):
+    '''The compile was cancelled before it finished.'''
+
+
+class CompileTimeout(CompileCancelled):
+    '''The compile ran out of time and was stopped.'''
+
+
+class CompileTicket(object):
+    '''A compile handed to a `CompileScheduler`.
+
+    `result()` waits for the PDF; `cancel()` takes the compile off the
+    queue, or stops pdflatex if it is already running.  Functions given to
+    `add_done_callback` are called with the ticket when it finishes, on the
+    scheduler's thread.
+    '''
+
+    def __init__(self, scheduler, tex, pdf_path, preamble, cache, mix,
+                 timeout):
+        self.tex = tex
+        self.pdf_path = pdf_path
+        self.preamble = preamble
+        self.cache = cache
+        self.mix = mix
+        self.timeout = timeout
+        self.state = 'queued'
+        self.seconds = None
+        self._scheduler = scheduler
+        self._error = None
+        self._stopped = None
+        self._process = None
+        self._done = threading.Event()
+        self._callbacks = []
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        '''Wait for the compile to finish; False if `timeout` ran out.'''
+        return self._done.wait(timeout)
+
+    def result(self):
+        '''Wait for the compile and return the PDF's path, or raise what
+        stopped it.'''
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self.pdf_path
+
+    def cancel(self):
+        '''Stop the compile; False if it had already finished.'''
+        return self._scheduler._stop(self, CompileCancelled(self.pdf_path))
+
+    def add_done_callback(self, callback):
+        with self._scheduler._lock:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _watch(self, process):
+        with self._scheduler._lock:
+            self._process = process
+            if self._stopped is None:
+                return
+        process.kill()
+
+
+class CompileScheduler(object):
+    '''Run pdflatex jobs a bounded number at a time, longest first.
+
+    Queued compiles are started in order of how long their problem mix took
+    to compile before, according to `times` (a `geckotex.CompileTimes`), so
+    that a long compile isn't left to run alone at the end of a batch.
+    Mixes that haven't been timed yet go first.  A compile that runs longer
+    than its timeout is stopped and fails with `CompileTimeout`.
+
+    `close()` waits for the queue to drain and saves the compile times;
+    leaving a `with` block on an exception cancels whatever is left.
+    '''
+
+    def __init__(self, concurrency=None, times=None, timeout=None):
+        self.concurrency = concurrency or multiprocessing.cpu_count()
+        self.times = times
+        self.timeout = timeout
+        self._queue = []
+        self._order = itertools.count()
+        self._lock = threading.Condition()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._work)
+                         for _ in xrange(self.concurrency)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, tex, pdf_path, preamble=None, cache=None, mix=None,
+               timeout=None):
+        '''Queue a compile of `tex` to `pdf_path`; returns its ticket.'''
+        ticket = CompileTicket(self, tex, pdf_path, preamble, cache, mix,
+                               timeout or self.timeout)
+        estimate = None
+        if self.times is not None and mix is not None:
+            estimate = self.times.estimate(mix)
+        if estimate is None:
+            estimate = float('inf')
+        with self._lock:
+            if self._closed:
+                raise ValueError('submit to a closed scheduler')
+            heapq.heappush(self._queue, (-estimate, next(self._order),
+                                         ticket))
+            self._lock.notify()
+        return ticket
+
+    def cancel_all(self):
+        '''Cancel every compile that hasn't finished.'''
+        with self._lock:
+            tickets = [ticket for _, _, ticket in self._queue]
+            tickets += [thread.ticket for thread in self._threads
+                        if getattr(thread, 'ticket', None) is not None]
+        for ticket in tickets:
+            ticket.cancel()
+
+    def close(self):
+        '''Wait for every queued compile, then save the compile times.'''
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        for thread in self._threads:
+            thread.join()
+        if self.times is not None:
+            self.times.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.cancel_all()
+        self.close()
+
+    def _work(self):
+        thread = threading.current_thread()
+        while True:
+            with self._lock:
+                while not self._queue and not self._closed:
+                    self._lock.wait()
+                if not self._queue:
+                    return
+                _, _, ticket = heapq.heappop(self._queue)
+                if ticket.state != 'queued':
+                    # cancelled while it waited
+                    continue
+                ticket.state = 'running'
+                thread.ticket = ticket
+            self._run(ticket)
+            thread.ticket = None
+
+    def _run(self, ticket):
+        timer = None
+        if ticket.timeout:
+            timer = threading.Timer(ticket.timeout, self._stop,
+                                    (ticket, CompileTimeout(ticket.pdf_path)))
+            timer.daemon = True
+            timer.start()
+
+        start = time.time()
+        error = None
+        try:
+            compile_job(ticket.tex, ticket.pdf_path, ticket.preamble,
+                        ticket.cache, ticket._watch)
+        except Exception as failure:
+            error = failure
+        finally:
+            if timer is not None:
+                timer.cancel()
+                # so that no timer thread is left waiting at exit
+                timer.join()
+        ticket.seconds = time.time() - start
+
+        if error is None:
+            # cache hits say nothing about how long the mix takes to compile
+            if (self.times is not None and ticket.mix is not None
+                    and ticket._process is not None):
+                self.times.record(ticket.mix, ticket.seconds)
+        else:
+            error = ticket._stopped or error
+        self._finish(ticket, error)
 
-    logging.debug('texout: \n %s', texout)
-    logging.debug('texerr: \n %s', texerr)
+    def _stop(self, ticket, error):
+        with self._lock:
+            if ticket.done() or ticket._stopped is not None:
+                return False
+            ticket._stopped = error
+            process = ticket._process
+            queued = ticket.state == 'queued'
+            if queued:
+                ticket.state = 'cancelled'
+        if queued:
+            self._finish(ticket, error)
+        elif process is not None and process.poll() is None:
+            process.kill()
+        return True
 
-    os.rename('texput.pdf', soln_path)
+    def _finish(self, ticket, error):
+        with self._lock:
+            ticket._error = error
+            if ticket.state == 'running':
+                if error is None:
+                    ticket.state = 'done'
+                elif type(error) is CompileCancelled:
+                    ticket.state = 'cancelled'
+                else:
+                    ticket.state = 'failed'
+            ticket.tex = None
+            ticket._done.set()
+            callbacks, ticket._callbacks = ticket._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(ticket)
+            except Exception:
+                logging.exception('compile callback failed')
 
-    os.remove('texput.aux')
-    os.remove('texput.log')
+
+def strip_tex(path):
+    '''`path` without its extension if that is `.tex`.'''
+    root, ext = os.path.splitext(path)
+    return root if ext == '.tex' else path
+
+
+def worksheet_seed(config):
+    '''The worksheet seed from the config, or a fresh random one.'''
+    if config.has_option('worksheet', 'seed'):
+        return config.get('worksheet', 'seed')
+    return random.SystemRandom().getrandbits(64)
+
+
+def pdf_cache(config):
+    '''The PDF cache, sized as the config asks.'''
+    cache = geckotex.pdf_cache
+    if config.has_option('cache', 'max_size'):
+        # megabytes
+        cache.max_bytes = config.getint('cache', 'max_size') * 1024 * 1024
+    return cache
+
+
+def make_worksheet(config, prob_path, soln_path, seed=None,
+                   fragments=None, progress=None, watch=None, pool=None):
+    '''Generate one problems/solutions pair and compile it to PDF.
+
+    Both documents are streamed into pdflatex as they are generated.  The
+    problems are drawn from `seed`, or from `worksheet_seed(config)`.
+    Sections are reused from the `fragments` cache where they can be, and
+    problems are taken from the `pool` if one is given.
+
+    `progress` is called as each section is written (see `write_to_files`)
+    and with 'compile' and the path of each PDF once it is made.  `watch`
+    is called with each `CompileStream`, so that another thread can cancel
+    it.
+    '''
+    if seed is None:
+        seed = worksheet_seed(config)
+    logging.info('%s: worksheet seed %s', prob_path, seed)
+
+    prob_path = strip_tex(prob_path)
+    soln_path = strip_tex(soln_path)
+
+    cache = pdf_cache(config)
+    preamble = config.get('LaTeX', 'preamble')
+    probtex = CompileStream(prob_path, preamble, cache)
+    solntex = CompileStream(soln_path, preamble, cache)
+    if watch is not None:
+        watch(probtex)
+        watch(solntex)
+    try:
+        write_to_files(probtex, solntex, config, seed, fragments, progress,
+                       pool)
+    except:
+        probtex.abort()
+        solntex.abort()
+        raise
+
+    logging.debug("compiling the TeX files")
+    try:
+        probtex.close()
+        if progress is not None:
+            progress('compile', prob_path)
+    finally:
+        solntex.close()
+    if progress is not None:
+        progress('compile', soln_path)
+    logging.debug('PDF cache: %(hits)d hits, %(misses)d misses', cache.stats())
+
+
+class WorksheetJob(object):
+    '''Make a worksheet on a background thread, with progress and cancel.
+
+    `progress` is called with the number of steps done, the number of
+    steps in all and a description of the step just finished; there is a
+    step for each section with problems and one for each PDF.  `finished`
+    is called once at the end with None, or with the exception that stopped
+    the job: a `CompileCancelled` if it was cancelled.  Both are called on
+    the job's thread, so a GUI has to hand them over to its own.
+    '''
+
+    def __init__(self, config, prob_path, soln_path, progress=None,
+                 finished=None, seed=None, fragments=None, pool=None):
+        self.config = config
+        self.prob_path = prob_path
+        self.soln_path = soln_path
+        self.seed = seed
+        self.fragments = fragments
+        self.pool = pool
+        self.total = 2 + sum(1 for probtype in plugins.probtypes()
+                             if config.getint(probtype.name, 'nprobs'))
+        self.done = 0
+        self._progress = progress
+        self._finished = finished
+        self._cancelled = threading.Event()
+        self._streams = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        '''Stop the job, killing any pdflatex it is running.  The section
+        being generated is finished first.'''
+        self._cancelled.set()
+        with self._lock:
+            streams = list(self._streams)
+        for stream in streams:
+            stream.cancel()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def _watch(self, stream):
+        with self._lock:
+            self._streams.append(stream)
+        if self.cancelled():
+            stream.cancel()
+
+    def _step(self, kind, detail):
+        if self.cancelled():
+            raise CompileCancelled(self.prob_path)
+        self.done += 1
+        if kind == 'compile':
+            detail = 'compiled ' + os.path.basename(detail)
+        if self._progress is not None:
+            self._progress(self.done, self.total, detail)
+
+    def _run(self):
+        error = None
+        try:
+            make_worksheet(self.config, self.prob_path, self.soln_path,
+                           self.seed, self.fragments, self._step, self._watch,
+                           self.pool)
+        except CompileCancelled as cancelled:
+            logging.info('%s: cancelled', self.prob_path)
+            error = cancelled
+        except Exception as failure:
+            logging.exception('%s: making the worksheet failed',
+                              self.prob_path)
+            error = failure
+        if self._finished is not None:
+            self._finished(error)
 
 
 def main(config):
@@ -59,20 +754,461 @@ def main(config):
     soln_path = config.get('output', 'solutions')
     logging.debug("soln_path: %s" % soln_path)
 
-    ptex = StringIO.StringIO()
-    stex = StringIO.StringIO()
+    # only a fixed seed makes the same sections again
+    fragments = None
+    if config.has_option('worksheet', 'seed'):
+        fragments = geckotex.fragment_cache
+    make_worksheet(config, prob_path, soln_path, fragments=fragments)
+
+
+def read_config(path, overrides=None):
+    '''Read the config at `path`, with any `overrides` applied.'''
+    config = ConfigParser.ConfigParser()
+    if not config.read(path):
+        raise IOError('cannot read {}'.format(path))
+    return apply_overrides(config, overrides or {})
+
+
+def watch(path, overrides=None, interval=1.0):
+    '''Rebuild the worksheet whenever the config at `path` changes.
+
+    Unless the config sets one, a seed is picked once for the whole
+    session, so that every section whose settings are unchanged comes out
+    the same and is copied from the fragment cache; only edited sections
+    are regenerated, and a document whose TeX didn't change at all comes
+    from the PDF cache.  Runs until interrupted.
+    '''
+    seed = random.SystemRandom().getrandbits(64)
+    fragments = geckotex.fragment_cache
+    logging.info('watching %s', path)
+    built = None
+    while True:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if mtime is not None and mtime != built:
+            built = mtime
+            before = fragments.stats()
+            start = time.time()
+            try:
+                config = read_config(path, overrides)
+                if not config.has_option('worksheet', 'seed'):
+                    if not config.has_section('worksheet'):
+                        config.add_section('worksheet')
+                    config.set('worksheet', 'seed', str(seed))
+                make_worksheet(config, config.get('output', 'problems'),
+                               config.get('output', 'solutions'),
+                               fragments=fragments)
+            except Exception:
+                logging.exception('rebuilding from %s failed', path)
+            else:
+                after = fragments.stats()
+                logging.info('rebuilt in %.2fs: %d sections reused, '
+                             '%d regenerated', time.time() - start,
+                             after['hits'] - before['hits'],
+                             after['misses'] - before['misses'])
+        time.sleep(interval)
+
+
+def variant_path(path, label):
+    '''Insert a variant label before the extension of an output path.'''
+    root, ext = os.path.splitext(path)
+    label = re.sub(r'[^\w.-]+', '_', label)
+    return '{root}-{label}{ext}'.format(root=root, label=label, ext=ext)
+
+
+def _variant_seed(config, label):
+    '''The seed for one variant of a batch, or None to pick a fresh one.'''
+    if config.has_option('worksheet', 'seed'):
+        # each variant gets its own seed, reproducible from the batch's
+        return Problems.problem_seed(config.get('worksheet', 'seed'),
+                                     'variant', label)
+    return None
+
+
+def variant_outputs(config, label):
+    '''The problems and solutions PDF paths for one variant.'''
+    return tuple(strip_tex(variant_path(config.get('output', document),
+                                        label))
+                 for document in ('problems', 'solutions'))
+
+
+def _make_variant(args):
+    '''Pool worker: build the worksheet for a single variant.  Returns its
+    label and, if it failed, why; a failure only fails this variant.'''
+    config, label = args
+    prob_path, soln_path = variant_outputs(config, label)
+    try:
+        make_worksheet(config, prob_path, soln_path,
+                       _variant_seed(config, label))
+    except Exception as error:
+        return label, str(error) or type(error).__name__
+    return label, None
+
 
-    write_to_files(ptex, stex, config)
+def _write_variant(args):
+    '''Pool worker: write the TeX for a single variant, to be compiled by
+    the parent's `CompileScheduler`.'''
+    config, label = args
+    seed = _variant_seed(config, label)
+    if seed is None:
+        seed = worksheet_seed(config)
+    logging.info('variant %s: worksheet seed %s', label, seed)
+    probtex, solntex = StringIO.StringIO(), StringIO.StringIO()
+    write_to_files(probtex, solntex, config, seed)
+    return config, label, probtex.getvalue(), solntex.getvalue()
 
-    prob_path = prob_path.rstrip('.tex')
-    soln_path = soln_path.rstrip('.tex')
 
-    compile_to_TeX(ptex, stex, prob_path, soln_path)
+def _schedule_variants(pool, tasks, compile_jobs, compile_timeout, finished):
+    '''Write the variants on the pool and compile them on a scheduler,
+    calling `finished` with each variant's label once both its PDFs are
+    made.  A compile that fails or times out only fails its own variant;
+    returns the labels of the variants that failed.'''
+    preambles = set()
+    lock = threading.Lock()
+    remaining = {}
+
+    def compiled(ticket):
+        if ticket.state != 'done':
+            return
+        with lock:
+            remaining[ticket.label] -= 1
+            if remaining[ticket.label]:
+                return
+        finished(ticket.label)
+
+    tickets = []
+    scheduler = CompileScheduler(compile_jobs, geckotex.CompileTimes(),
+                                 compile_timeout)
+    with scheduler:
+        for config, label, probtex, solntex in pool.imap_unordered(
+                _write_variant, tasks):
+            preamble = config.get('LaTeX', 'preamble')
+            if preamble not in preambles:
+                # build the format up front so the compiles don't all
+                # build it
+                geckotex.preamble_format(preamble)
+                preambles.add(preamble)
+            remaining[label] = 2
+            paths = variant_outputs(config, label)
+            for document, tex, path in zip(('problems', 'solutions'),
+                                           (probtex, solntex), paths):
+                ticket = scheduler.submit(tex, path, preamble,
+                                          pdf_cache(config),
+                                          compile_mix(config, document))
+                ticket.label = label
+                ticket.add_done_callback(compiled)
+                tickets.append(ticket)
+        failed = set()
+        for ticket in tickets:
+            try:
+                ticket.result()
+            except CompileTimeout:
+                logging.error('variant %s: compiling %s timed out',
+                              ticket.label, ticket.pdf_path)
+                failed.add(ticket.label)
+            except Exception as error:
+                logging.error('variant %s: compiling %s failed: %s',
+                              ticket.label, ticket.pdf_path,
+                              str(error) or type(error).__name__)
+                failed.add(ticket.label)
+            else:
+                logging.debug('compiled %s in %.2fs', ticket.pdf_path,
+                              ticket.seconds)
+    return sorted(failed)
+
+
+RosterRow = collections.namedtuple('RosterRow', ['label', 'overrides'])
+
+
+def parse_override(setting):
+    '''Split a `SECTION.option=value` setting into ((section, option),
+    value).'''
+    name, equals, value = setting.partition('=')
+    section, dot, option = name.strip().rpartition('.')
+    if not equals or not dot or not section or not option:
+        raise ValueError('{!r} is not SECTION.option=value'.format(setting))
+    return (section, option), value.strip()
+
+
+def apply_overrides(config, overrides):
+    '''A copy of `config` with each (section, option) set to its value.'''
+    copy = ConfigParser.ConfigParser()
+    for section in config.sections():
+        copy.add_section(section)
+        for option, value in config.items(section, raw=True):
+            copy.set(section, option, value)
+    for (section, option), value in sorted(overrides.items()):
+        if not copy.has_section(section):
+            copy.add_section(section)
+        copy.set(section, option, value)
+    return copy
+
+
+def read_roster(stream):
+    '''Read a CSV roster into a list of `RosterRow`s.
+
+    If the first row has a column called "name", it is a header: each row
+    is labelled by its name, and every other column, which must be called
+    SECTION.option, overrides that option for the row's worksheet (empty
+    cells are left alone).  Otherwise every row is labelled by its first
+    cell, so a plain list of names works too.
+    '''
+    rows = [row for row in csv.reader(stream) if any(cell.strip()
+                                                     for cell in row)]
+    if not rows:
+        return []
+
+    header = [cell.strip() for cell in rows[0]]
+    if 'name' not in [cell.lower() for cell in header]:
+        return [RosterRow(row[0].strip(), {}) for row in rows]
+
+    name_column = [cell.lower() for cell in header].index('name')
+    columns = {}
+    for index, column in enumerate(header):
+        if index != name_column:
+            columns[index] = parse_override(column + '=')[0]
+
+    roster = []
+    for row in rows[1:]:
+        overrides = dict((columns[index], cell.strip())
+                         for index, cell in enumerate(row)
+                         if index in columns and cell.strip())
+        roster.append(RosterRow(row[name_column].strip(), overrides))
+    return roster
+
+
+def spec_hash(config, label):
+    '''A hash of everything that decides a variant's worksheet: its label
+    and its whole config.'''
+    digest = hashlib.sha1(label)
+    for section in sorted(config.sections()):
+        for option, value in sorted(config.items(section, raw=True)):
+            digest.update('\0'.join((section, option, value)) + '\n')
+    return digest.hexdigest()
+
+
+def manifest_path(config):
+    '''Where a batch records the spec hash of every variant it made.'''
+    root, _ = os.path.splitext(config.get('output', 'problems'))
+    return root + '.manifest.json'
+
+
+def _load_manifest(path):
+    try:
+        with open(path) as manifest:
+            return json.load(manifest)
+    except (IOError, ValueError):
+        return {}
+
+
+def _save_manifest(path, manifest):
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(handle, 'w') as tmp:
+            json.dump(manifest, tmp, indent=1, sort_keys=True)
+        os.rename(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class Progress(object):
+    '''Log each finished variant with the rate so far and an ETA.'''
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.start = time.time()
+
+    def __call__(self, label):
+        self.done += 1
+        elapsed = time.time() - self.start
+        rate = self.done / elapsed if elapsed else float('inf')
+        eta = (self.total - self.done) / rate
+        logging.info('[%d/%d] %s done, %.2f variants/sec, ETA %s',
+                     self.done, self.total, label, rate,
+                     datetime.timedelta(seconds=int(round(eta))))
+
+
+def batch(config, variants=None, roster=None, jobs=None, compile_jobs=None,
+          compile_timeout=None, resume=False):
+    '''Generate a distinct worksheet for every variant on a process pool.
+
+    Either give a number of `variants`, which are labelled 1, 2, ..., or a
+    `roster` of names or `RosterRow`s to label them with; a row's overrides
+    apply to its worksheet only.  The work is spread over `jobs` processes,
+    one per core by default, and progress is logged as variants finish.
+    Returns a summary of the run, including the labels of any variants
+    that `failed`.
+
+    With `compile_jobs`, the workers only write the TeX, and the parent
+    compiles it with a `CompileScheduler` that runs that many pdflatex jobs
+    at once, the longest first, stopping any that take longer than
+    `compile_timeout` seconds.
+
+    The spec hash of every variant made is recorded in a manifest next to
+    the output (see `manifest_path`).  With `resume`, variants whose PDFs
+    exist and whose spec hash matches the manifest are skipped.
+    '''
+    if roster is None:
+        width = len(str(variants))
+        roster = [str(index).zfill(width) for index in xrange(1, variants + 1)]
+    roster = [RosterRow(row, {}) if isinstance(row, basestring) else row
+              for row in roster]
+    labels = [row.label for row in roster]
+    if len(set(labels)) != len(labels):
+        raise ValueError('the roster has the same name more than once')
+    row_configs = [apply_overrides(config, row.overrides) for row in roster]
+    # names that differ only in characters a file name can't have would
+    # overwrite each other's PDFs
+    owners = {}
+    for row, row_config in zip(roster, row_configs):
+        for path in variant_outputs(row_config, row.label):
+            owner = owners.setdefault(path, row.label)
+            if owner != row.label:
+                raise ValueError("the roster names '{}' and '{}' would both "
+                                 'be written to {}'.format(owner, row.label,
+                                                           path))
+    jobs = jobs or multiprocessing.cpu_count()
+
+    manifest_file = manifest_path(config)
+    manifest = _load_manifest(manifest_file)
+    tasks, specs = [], {}
+    for row, row_config in zip(roster, row_configs):
+        specs[row.label] = spec_hash(row_config, row.label)
+        if (resume and manifest.get(row.label) == specs[row.label]
+                and all(os.path.exists(path)
+                        for path in variant_outputs(row_config, row.label))):
+            continue
+        tasks.append((row_config, row.label))
+    skipped = len(roster) - len(tasks)
+    if skipped:
+        logging.info('skipping %d variants that are already made', skipped)
+
+    logging.info('generating %d variants with %d jobs', len(tasks), jobs)
+    start = time.time()
+    progress = Progress(len(tasks))
+    lock = threading.Lock()
+
+    def finished(label):
+        with lock:
+            manifest[label] = specs[label]
+            _save_manifest(manifest_file, manifest)
+            progress(label)
+
+    # generate a problem of each type on the worksheets before forking, so
+    # the workers share the imports, caches and banks instead of each
+    # loading them again
+    pool = workers.warm_pool(jobs, [
+        probtype for probtype in plugins.probtypes()
+        if any(task_config.getint(probtype.name, 'nprobs')
+               for task_config, _ in tasks)])
+    failed = []
+    try:
+        if compile_jobs:
+            failed = _schedule_variants(pool, tasks, compile_jobs,
+                                        compile_timeout, finished)
+        else:
+            for label, error in pool.imap_unordered(_make_variant, tasks):
+                if error is None:
+                    finished(label)
+                else:
+                    logging.error('variant %s failed: %s', label, error)
+                    failed.append(label)
+            failed.sort()
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = time.time() - start
+
+    summary = {
+        'variants': len(tasks),
+        'skipped': skipped,
+        'jobs': jobs,
+        'seconds': elapsed,
+        'variants_per_sec': len(tasks) / elapsed if elapsed else float('inf'),
+        'failed': failed,
+    }
+    logging.info('generated %(variants)d variants in %(seconds).2fs '
+                 '(%(variants_per_sec).2f variants/sec)', summary)
+    if failed:
+        logging.error('%d variants failed: %s', len(failed),
+                      ', '.join(failed))
+    return summary
 
 
 if __name__ == '__main__':
-    config = ConfigParser.ConfigParser()
-    config.read('geckomath.ini')
+    parser = argparse.ArgumentParser(
+        description='Generate worksheets and answer keys as PDFs.')
+    parser.add_argument('-f', '--config', default='geckomath.ini',
+                        help='the worksheet config (default: geckomath.ini)')
+    parser.add_argument('-n', '--variants', type=int,
+                        help='generate this many distinct worksheets')
+    parser.add_argument('-r', '--roster', type=argparse.FileType('r'),
+                        help='generate one worksheet per row of this CSV '
+                             'file; with a "name" column, the other columns '
+                             'are SECTION.option overrides for each row')
+    parser.add_argument('--set', dest='overrides', action='append',
+                        default=[], metavar='SECTION.option=VALUE',
+                        help='override a config option for every worksheet')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='number of worker processes (default: one per core)')
+    parser.add_argument('-c', '--compile-jobs', type=int,
+                        help='with -n or -r, compile the worksheets with this '
+                             'many pdflatex jobs at once, longest first')
+    parser.add_argument('-t', '--compile-timeout', type=float,
+                        help='with --compile-jobs, stop any compile that '
+                             'takes longer than this many seconds')
+    parser.add_argument('--resume', action='store_true',
+                        help='with -n or -r, skip worksheets that were '
+                             'already made from the same spec')
+    parser.add_argument('-s', '--seed',
+                        help='worksheet seed (overrides [worksheet] seed)')
+    parser.add_argument('-e', '--events', type=argparse.FileType('a'),
+                        help='append timing events to this file as JSON lines')
+    parser.add_argument('-w', '--watch', action='store_true',
+                        help='rebuild the worksheet whenever the config '
+                             'changes, regenerating only the edited sections')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='log debugging detail, including pdflatex output')
+    args = parser.parse_args()
+
+    if args.events:
+        instrumentation.add_sink(instrumentation.JSONLinesSink(args.events))
+
+    try:
+        overrides = dict(parse_override(setting)
+                         for setting in args.overrides)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.seed is not None:
+        overrides['worksheet', 'seed'] = args.seed
+    try:
+        config = read_config(args.config, overrides)
+    except IOError as error:
+        parser.error(str(error))
 
-    logging.basicConfig(level=logging.DEBUG)
-    main(config)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    batch_options = dict(jobs=args.jobs, compile_jobs=args.compile_jobs,
+                         compile_timeout=args.compile_timeout,
+                         resume=args.resume)
+    if args.watch:
+        try:
+            watch(args.config, overrides)
+        except KeyboardInterrupt:
+            pass
+    elif args.roster:
+        try:
+            roster = read_roster(args.roster)
+        except ValueError as error:
+            parser.error(str(error))
+        summary = batch(config, roster=roster, **batch_options)
+        sys.exit(1 if summary['failed'] else 0)
+    elif args.variants:
+        summary = batch(config, variants=args.variants, **batch_options)
+        sys.exit(1 if summary['failed'] else 0)
+    else:
+        main(config)
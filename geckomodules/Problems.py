@@ -1,23 +1,322 @@
+import bisect
+import collections
+import hashlib
+import logging
+import random
+import time
+
+import bank
+import instrumentation
+
 PROBTYPES = list()
+# every problem class, printable or not, in the order they were defined
+REGISTRY = list()
+
+# How many times each derived field was computed, and how many times a cached
+# value was handed out instead of being computed again.  Both are keyed by
+# 'ClassName.field'.
+DERIVED_COMPUTED = collections.Counter()
+DERIVED_REUSED = collections.Counter()
+
+# How many times to redraw a problem without a parameter space whose key is
+# already on the worksheet, before settling for a repeat.
+MAX_REDRAWS = 100
+
+
+def derived_stats():
+    '''Map each derived field to its (computed, reused) counts.'''
+    return dict((field, (DERIVED_COMPUTED[field], DERIVED_REUSED[field]))
+                for field in DERIVED_COMPUTED)
+
+
+def generator(rng):
+    '''`rng` if it is a `random.Random`, or else a generator seeded with it
+    (freshly seeded if it is None).'''
+    if isinstance(rng, random.Random):
+        return rng
+    return random.Random(rng)
+
+
+def problem_seed(worksheet_seed, section, index):
+    '''The seed for problem number `index` of `section` on a worksheet.
+
+    Seeds are derived by hashing, so every problem gets an independent
+    stream that doesn't depend on how many problems came before it or on
+    which process generates it.
+    '''
+    key = '\0'.join(str(part) for part in (worksheet_seed, section, index))
+    return int(hashlib.sha1(key).hexdigest()[:16], 16)
+
+
+class derived(object):
+    '''A field of a problem that is computed from its parameters on demand.
+
+    Use it like `property`.  The value is computed the first time it is read
+    and cached on the instance, so intermediate results that several other
+    fields need (or that are read more than once) are only computed once.
+    '''
+
+    def __init__(self, func):
+        self.func = func
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        cache = instance.__dict__.setdefault('_derived', {})
+        field = '.'.join([owner.__name__, self.__name__])
+        try:
+            value = cache[self.__name__]
+        except KeyError:
+            value = cache[self.__name__] = self.func(instance)
+            DERIVED_COMPUTED[field] += 1
+        else:
+            DERIVED_REUSED[field] += 1
+        return value
+
+
+class ParamSpace(object):
+    '''The finite set of parameters a problem type can be drawn with.
+
+    Each dimension is a pair of a name and a sequence of values.  The name
+    may be a tuple of names when the values are tuples, for parameters that
+    depend on each other.  A key is a tuple holding one value from each
+    dimension, and the keys are numbered 0..size-1 in mixed radix.
+    '''
+
+    def __init__(self, *dims):
+        self.dims = dims
+        self.size = 1
+        for _, values in dims:
+            self.size *= len(values)
+        self._digits = None
+
+    def key(self, index):
+        '''The key numbered `index`.'''
+        key = []
+        for _, values in reversed(self.dims):
+            index, digit = divmod(index, len(values))
+            key.append(values[digit])
+        key.reverse()
+        return tuple(key)
+
+    def index(self, key):
+        '''The number of `key`; the inverse of `key()`.'''
+        if self._digits is None:
+            self._digits = [dict((value, digit)
+                                 for digit, value in enumerate(values))
+                            for _, values in self.dims]
+        index = 0
+        for (_, values), digits, value in zip(self.dims, self._digits, key):
+            index = index * len(values) + digits[value]
+        return index
+
+    def params(self, key):
+        '''Map each parameter name to its value in `key`.'''
+        params = {}
+        for (names, _), value in zip(self.dims, key):
+            if isinstance(names, tuple):
+                params.update(zip(names, value))
+            else:
+                params[names] = value
+        return params
+
+
+class UniqueIndex(object):
+    '''Draws numbers from xrange(size) without replacement.
+
+    Only the numbers drawn so far are stored, in sorted order.  A draw picks
+    the rank of a number among those left and finds the number with that
+    rank by bisecting, so it never has to retry however few are left.
+    '''
+
+    def __init__(self, size):
+        self.size = size
+        self.used = []
+
+    def remaining(self):
+        return self.size - len(self.used)
+
+    def draw(self, rng):
+        rank = rng.randrange(self.remaining())
+        # the smallest number with `rank` unused numbers below it
+        number = rank
+        while True:
+            shifted = rank + bisect.bisect_right(self.used, number)
+            if shifted == number:
+                break
+            number = shifted
+        bisect.insort(self.used, number)
+        return number
+
+
+class ProblemRecord(collections.namedtuple('ProblemRecord',
+                                           ['probtype', 'key'])):
+    '''A problem as the parameters it was drawn with, and nothing else.
+
+    A record is a problem type and its `key`, a short tuple of numbers and
+    strings.  Records are cheap to hold by the million, pickle in a few
+    dozen bytes, and are equal exactly when their problems are; none of
+    the text is rendered until `render()` is called.
+    '''
+    __slots__ = ()
+
+    def render(self):
+        '''The problem this record describes.'''
+        return next(self.probtype.render([self]))
+
 
 class RegisteringClass(type):
     def __init__(cls, name, bases, dct):
+        REGISTRY.append(cls)
         if cls.printable:
             PROBTYPES.append(cls)
         super(RegisteringClass, cls).__init__(name, bases, dct)
 
 
 class Problem(object):
-    '''A problem parent object.'''
+    '''A problem parent object.
+
+    A problem is drawn in two steps.  `sample` draws its parameters as a
+    tuple, its `key`, and a problem built from a key sets the parameters
+    as attributes and renders its fields from them when they are first
+    read.  A problem type whose parameters come from a small finite set
+    declares it as a `ParamSpace` in `space`, and keys are drawn from it;
+    other types name the parameters in their keys in `params` and
+    override `sample` to draw them.  If a type with a `space` also has
+    `bank_options`, its problems are taken from a precomputed `bank`.
+    '''
 
     __metaclass__ = RegisteringClass
     printable = False
+    space = None
+    # the names of the parameters in a key, for types without a space
+    params = ()
+    # the keyword arguments to build a problem bank with, one dict per bank;
+    # the bank built with none of them is used when writing worksheets
+    bank_options = None
 
-    def __init__(self):
+    def __init__(self, rng=None, key=None):
+        '''Draw a problem using `rng`, which may be a `random.Random` or a
+        seed for one.  By default a freshly seeded generator is used.  Give
+        the `key` instead to build that exact problem.'''
         super(Problem, self).__init__()
+        if key is None:
+            key = self.sample(generator(rng))
+        self.key = key
+        if self.space is not None:
+            self.__dict__.update(self.space.params(key))
+        else:
+            self.__dict__.update(zip(self.params, key))
+
+    @classmethod
+    def sample(cls, rng):
+        '''Draw the key of a problem of this type from the `random.Random`
+        `rng`.  Two problems with the same key are the same problem.
+
+        A type without a `space` or `params` has no parameters, and so
+        only the one key, ().'''
+        if cls.space is None:
+            return ()
+        return cls.space.key(rng.randrange(cls.space.size))
+
+    @classmethod
+    def draw_records(cls, count, seed=None):
+        '''Draw `count` `ProblemRecord`s of this type with no two alike.
+
+        Problem i is drawn from a generator seeded from `seed` and i, so the
+        same seed gives the same problems.  When a type has fewer distinct
+        problems than `count`, a warning is logged and they start repeating
+        once all of them are used.  Nothing is rendered.
+        '''
+        space = cls.space
+        if space is not None:
+            if count > space.size:
+                logging.warning('%s: %d problems requested, but there are '
+                                'only %d distinct ones', cls.__name__, count,
+                                space.size)
+            index = UniqueIndex(space.size)
+        else:
+            seen = set()
+
+        for i in xrange(count):
+            if seed is None:
+                rng = random.Random()
+            else:
+                rng = random.Random(problem_seed(seed, cls.__name__, i))
+
+            if space is not None:
+                if not index.remaining():
+                    index = UniqueIndex(space.size)
+                yield ProblemRecord(cls, space.key(index.draw(rng)))
+                continue
+
+            for _ in xrange(MAX_REDRAWS):
+                key = cls.sample(rng)
+                if key not in seen:
+                    break
+            else:
+                logging.warning('%s: no new problem in %d draws; repeating '
+                                'one', cls.__name__, MAX_REDRAWS)
+            seen.add(key)
+            yield ProblemRecord(cls, key)
 
     @classmethod
-    def write_probs(cls, probtex, solntex, nprobs, solutions=False):
+    def render(cls, records):
+        '''The problems described by `records` of this type, each built as
+        it is asked for; from the bank, if the type has one.'''
+        problem_bank = None
+        if (cls.space is not None and cls.bank_options is not None
+                and {} in cls.bank_options):
+            problem_bank = bank.load_bank(cls)
+
+        for record in records:
+            if problem_bank is None:
+                yield cls(key=record.key)
+            else:
+                number = cls.space.index(record.key)
+                yield bank.Record(record.key, *problem_bank.fields(number))
+
+    @classmethod
+    def draw_unique(cls, count, seed=None):
+        '''Generate `count` problems of this type with no two keys alike,
+        drawn as `draw_records` draws them.'''
+        return cls.render(cls.draw_records(count, seed))
+
+    @classmethod
+    def generate(cls, worksheet_seed, index):
+        '''Problem number `index` of this type on the worksheet with seed
+        `worksheet_seed`.
+
+        The problems before it are drawn again too, since it depends on
+        them to be different from them.
+        '''
+        for prob in cls.draw_unique(index + 1, worksheet_seed):
+            pass
+        return prob
+
+    @classmethod
+    def write_probs(cls, probtex, solntex, nprobs, solutions=False,
+                    seed=None, problems=None):
+        '''Print a section of `nprobs` problems and their answers or
+        solutions, drawn from `seed`, or the ready-made `problems` if given.
+
+        `problems` may be any iterable, and is timed like drawn problems
+        when instrumentation is on:
+
+        >>> import StringIO
+        >>> from probability import TwoVarChanceProb
+        >>> sink = instrumentation.Collector()
+        >>> instrumentation.add_sink(sink)
+        >>> problems = list(TwoVarChanceProb.draw_unique(2, 'doctest'))
+        >>> out = StringIO.StringIO()
+        >>> TwoVarChanceProb.write_probs(out, out, 2, problems=problems)
+        >>> instrumentation.remove_sink(sink)
+        >>> [(event['event'], event['count']) for event in sink]
+        [('write_probs', 2)]
+        '''
         if not nprobs:
             return
 
@@ -28,8 +327,12 @@ class Problem(object):
         print >>probtex, r'\begin{enumerate}'
         print >>solntex, r'\begin{enumerate}'
 
-        for _ in xrange(nprobs):
-            prob = cls()
+        if problems is None:
+            problems = cls.draw_unique(nprobs, seed)
+        if instrumentation.enabled():
+            problems = _timed(cls, problems, solutions)
+
+        for prob in problems:
             print >>probtex, r'\item', prob.statement
             print >>solntex, r'\item', prob.statement
             if solutions:
@@ -39,3 +342,30 @@ class Problem(object):
 
         print >>probtex, r'\end{enumerate}'
         print >>solntex, r'\end{enumerate}'
+
+
+def _timed(cls, problems, solutions):
+    '''Pass `problems` through, timing how long each takes to draw and to
+    render the fields that `write_probs` prints.  The totals for the type
+    are emitted as a `write_probs` event at the end.'''
+    problems = iter(problems)
+    fields = ('statement', 'solution' if solutions else 'answer')
+    totals = dict.fromkeys(('construct',) + fields, 0.0)
+    count = 0
+    start = time.time()
+    while True:
+        before = time.time()
+        try:
+            prob = next(problems)
+        except StopIteration:
+            break
+        totals['construct'] += time.time() - before
+        for field in fields:
+            before = time.time()
+            getattr(prob, field)
+            totals[field] += time.time() - before
+        count += 1
+        yield prob
+
+    instrumentation.emit('write_probs', type=cls.__name__, count=count,
+                         seconds=time.time() - start, **totals)
@@ -1,10 +1,6 @@
-import random
-
-from sympy import *
-# XXX: I am a terrible person for making this a global var
-x = symbols('x')
-
-from Problems import Problem
+# sympy is only imported once the first problem here is generated
+from lazyimport import sympy
+from Problems import ParamSpace, Problem, derived
 
 class AbsValProb(Problem):
     '''An absolute value problem.
@@ -14,20 +10,52 @@ class AbsValProb(Problem):
 
     printable = True
     secname = 'Absolute-Value Inequalities'
-
-    def __init__(self):
-        super(AbsValProb, self).__init__()
-        self.LHS = Poly(random.randrange(1,101)*x + random.randrange(101), x)
-        self.RHS = Poly(random.randrange(-10,101), x)
-        self.compop = random.choice(['>', r'\geq', '<', r'\leq'])
-
-    @property
+    space = ParamSpace(
+        ('lead', xrange(1, 101)),
+        ('const', xrange(101)),
+        ('rhs', xrange(-10, 101)),
+        ('compop', ('>', r'\geq', '<', r'\leq')),
+    )
+
+    @derived
+    def LHS(self):
+        '''The polynomial inside the absolute value.'''
+        x = sympy.Symbol('x')
+        return sympy.Poly(self.lead*x + self.const, x)
+
+    @derived
+    def RHS(self):
+        '''The right-hand side as a polynomial.'''
+        return sympy.Poly(self.rhs, sympy.Symbol('x'))
+
+    @derived
+    def a(self):
+        '''The coefficient on x inside the absolute value.'''
+        return sympy.Poly(self.LHS.LC(), sympy.Symbol('x'))
+
+    @derived
+    def b(self):
+        '''The constant inside the absolute value.'''
+        return sympy.Poly(self.LHS.TC(), sympy.Symbol('x'))
+
+    @derived
+    def c(self):
+        '''The right-hand side.'''
+        return self.RHS
+
+    @derived
+    def zeros(self):
+        '''The TeX for the endpoints of the solution set.'''
+        a, b, c = self.a, self.b, self.c
+        return sympy.latex((-c-b)/a), sympy.latex((c-b)/a)
+
+    @derived
     def statement(self):
         eqn = r'''\abs{{{0}}} {1} {2}
-        '''.format(latex(self.LHS), self.compop, latex(self.RHS))
+        '''.format(sympy.latex(self.LHS), self.compop, sympy.latex(self.RHS))
         return 'Solve ${}$.'.format(eqn)
 
-    @property
+    @derived
     def answer(self):
         if self.RHS.TC() < 0:
             if self.compop in ('>', r'\geq'):
@@ -35,10 +63,7 @@ class AbsValProb(Problem):
             else:
                 return 'No solution.'
 
-        a = Poly(self.LHS.LC(), x)
-        b = Poly(self.LHS.TC(), x)
-        c = self.RHS
-        zeros = [latex((-c-b)/a), latex((c-b)/a)]
+        zeros = self.zeros
         if self.compop in ('>', r'\geq'):
             opop = '<' if self.compop == '>' else r'\leq'
             ans = '${}$ or ${}$'.format(
@@ -51,19 +76,15 @@ class AbsValProb(Problem):
 
         return ans
 
-    @property
+    @derived
     def solution(self):
         if self.RHS.TC() < 0:
             return self.solve_trick_q()
 
-        a = Poly(self.LHS.LC(), x)
-        b = Poly(self.LHS.TC(), x)
-        c = self.RHS
-        zeros = [latex((-c-b)/a), latex((c-b)/a)]
         if self.compop in ('>', r'\geq'):
-            return self.solve_geq_q(a, b, c)
+            return self.solve_geq_q()
         else:
-            return self.solve_leq_q(a, b, c)
+            return self.solve_leq_q()
 
     def solve_trick_q(self):
         if self.compop in ('<', '\leq'):
@@ -77,7 +98,8 @@ class AbsValProb(Problem):
 
         return ans
 
-    def solve_geq_q(self, a, b, c):
+    def solve_geq_q(self):
+        b, c = self.b, self.c
         if self.compop == '>':
             opop = '<'
             openbrak, closebrak = '(', ')'
@@ -106,15 +128,17 @@ class AbsValProb(Problem):
             \left{openbrak}{RHS2}, \infty\right)
             \end{{align*}}
             '''.format( 
-                LHS=latex(self.LHS), opop=opop, nRHS=latex(-self.RHS),
-                compop=self.compop, RHS=latex(self.RHS), 
-                LHS1=latex(self.LHS - b), nRHS1=latex(-c-b), RHS1=latex(c-b),
-                nRHS2=latex((-c-b)/a), RHS2=latex((c-b)/a), openbrak=openbrak,
-                closebrak=closebrak
+                LHS=sympy.latex(self.LHS), opop=opop,
+                nRHS=sympy.latex(-self.RHS), compop=self.compop,
+                RHS=sympy.latex(self.RHS), LHS1=sympy.latex(self.LHS - b),
+                nRHS1=sympy.latex(-c-b), RHS1=sympy.latex(c-b),
+                nRHS2=self.zeros[0], RHS2=self.zeros[1],
+                openbrak=openbrak, closebrak=closebrak
             ) 
         return ans
 
-    def solve_leq_q(self, a, b, c):
+    def solve_leq_q(self):
+        b, c = self.b, self.c
         openbrak, closebrak = ('(', ')') if self.compop == '<' else ('[', ']')
         ans = r'''First, eliminate the absolute value by transforming the
         inequality into a linear inequality:
@@ -132,10 +156,11 @@ class AbsValProb(Problem):
         &\left{openbrak}{LB2}, {UB2}\right{closebrak}
         \end{{align*}}
         '''.format(
-            LB=latex(-c), compop=self.compop, LHS=latex(self.LHS), UB=latex(c),
-            LB1=latex(-c-b), LHS1=latex(self.LHS - b), UB1=latex(c-b),
-            LB2=latex((-c-b)/a), UB2=latex((c-b)/a), openbrak=openbrak,
-            closebrak=closebrak
+            LB=sympy.latex(-c), compop=self.compop, LHS=sympy.latex(self.LHS),
+            UB=sympy.latex(c), LB1=sympy.latex(-c-b),
+            LHS1=sympy.latex(self.LHS - b), UB1=sympy.latex(c-b),
+            LB2=self.zeros[0], UB2=self.zeros[1],
+            openbrak=openbrak, closebrak=closebrak
         )
 
         return ans
@@ -148,16 +173,18 @@ class RevAbsValProb(Problem):
 
     printable = True
     secname = 'Reverse Absolute-Value Inequalities'
-    
-    def __init__(self, full_simplify=False):
-        super(RevAbsValProb, self).__init__()
-        self.full_simplify = full_simplify
-        self.lower, self.upper = sorted([random.randrange(-10, 10),
-                                         random.randrange(-10, 10)])
-        self.inner = random.choice([True, False])
-        self.endp = random.choice([True, False])
-
-    @property
+    space = ParamSpace(
+        (('lower', 'upper'), [(lower, upper) for lower in xrange(-10, 10)
+                              for upper in xrange(lower, 10)]),
+        ('inner', (True, False)),
+        ('endp', (True, False)),
+    )
+    bank_options = ({},)
+    # scale the answer to clear its denominators; a property of the type
+    # rather than of each problem, so that a key always renders the same
+    full_simplify = False
+
+    @derived
     def statement(self):
         if self.inner:
             comp = r'\leq' if self.endp else '<'
@@ -182,52 +209,66 @@ class RevAbsValProb(Problem):
 
         return statement
 
-    @property
+    @derived
+    def endpoints(self):
+        '''The lower endpoint, x and the upper endpoint as polynomials.'''
+        x = sympy.Symbol('x')
+        return (sympy.Poly(self.lower, x), sympy.Poly(x, x),
+                sympy.Poly(self.upper, x))
+
+    @derived
+    def shift(self):
+        '''The midpoint of the interval.'''
+        low, _, hi = self.endpoints
+        if self.inner:
+            return low + (hi - low)/2
+        else:
+            return hi - (hi - low)/2
+
+    @derived
+    def inside(self):
+        '''What goes inside the absolute value.'''
+        return self.endpoints[1] - self.shift
+
+    @derived
+    def bound(self):
+        '''The right-hand side of the absolute-value inequality.'''
+        return self.endpoints[2] - self.shift
+
+    @derived
+    def simplified(self):
+        '''The scale that clears the denominators, and the scaled `inside`
+        and `bound`.'''
+        scale, inside = self.inside.clear_denoms(convert=True)
+        return scale, inside, self.bound.mul_ground(scale)
+
+    @derived
     def answer(self):
         if self.inner:
             comp = r'\leq' if self.endp else '<'
-
-            LHS, mid, RHS = Poly(self.lower, x), Poly(x, x), Poly(self.upper, x)
-            shift = LHS + (RHS - LHS)/2
-            inside = mid - shift
-            bound = RHS - shift
-
-            if self.full_simplify:
-                scale, inside = inside.clear_denoms(convert=True)
-                bound = bound.mul_ground(scale)
-
-            ans = r'''$\abs{{{inside}}} {comp} {bound}$'''.format(
-                inside=latex(inside), comp=comp, bound=latex(bound)
-            )
-
         else:
             comp = r'\geq' if self.endp else '>'
 
-            low, mid, hi = Poly(self.lower, x), Poly(x, x), Poly(self.upper, x)
-            shift = hi - (hi - low)/2
-            inside = mid - shift
-            bound = hi - shift
+        if self.full_simplify:
+            _, inside, bound = self.simplified
+        else:
+            inside, bound = self.inside, self.bound
 
-            if self.full_simplify:
-                scale, inside = inside.clear_denoms(convert=True)
-                bound = bound.mul_ground(scale)
-            
-            ans = r'''$\abs{{{inside}}} {comp} {bound}$'''.format(
-                inside=latex(inside), comp=comp, bound=latex(bound)
-            )
+        ans = r'''$\abs{{{inside}}} {comp} {bound}$'''.format(
+            inside=sympy.latex(inside), comp=comp, bound=sympy.latex(bound)
+        )
 
         return ans
 
-    @property
+    @derived
     def solution(self):
+        low, _, hi = self.endpoints
+        shift, inside, bound = self.shift, self.inside, self.bound
         if self.inner:
             comp = r'\leq' if self.endp else '<'
 
-            LHS, mid, RHS = Poly(self.lower, x), Poly(x, x), Poly(self.upper, x)
-            shift = LHS + (RHS - LHS)/2
-            inside = mid - shift
+            LHS, RHS = low, hi
             diff = RHS - LHS
-            bound = RHS - shift
             soln = r'''
             First look at the endpoints of the interval.  ${RHS}$
             and ${LHS}$ are ${diff}$ units apart, and half of ${diff}$ is
@@ -244,16 +285,13 @@ class RevAbsValProb(Problem):
             \[
             \abs{{{inside}}} {comp} {bound}.
             \]'''.format(
-                RHS=latex(RHS), LHS=latex(LHS), diff=latex(diff),
-                bound=latex(bound), shift=latex(shift), comp=comp,
-                inside=latex(inside)
+                RHS=sympy.latex(RHS), LHS=sympy.latex(LHS),
+                diff=sympy.latex(diff),
+                bound=sympy.latex(bound), shift=sympy.latex(shift), comp=comp,
+                inside=sympy.latex(inside)
             ) 
 
         else:
-            low, mid, hi = Poly(self.lower, x), Poly(x, x), Poly(self.upper, x)
-            shift = hi - (hi - low)/2
-            inside = mid - shift
-            bound = hi - shift
             lcomp, gcomp = (r'\leq', r'\geq') if self.endp else ('<', '>')
             comp = gcomp
             soln = r'''First look at the endpoints.  ${hi}$ and ${low}$ are
@@ -275,26 +313,36 @@ class RevAbsValProb(Problem):
                 \abs{{{inside}}} {gcomp} {bound}.
                 \]
                 '''.format(
-                    hi=latex(hi), low=latex(low), diff=latex(hi-low),
-                    bound=latex(bound), shift=latex(shift),
-                    lcomp=lcomp,gcomp=gcomp, inside=latex(inside)
+                    hi=sympy.latex(hi), low=sympy.latex(low),
+                    diff=sympy.latex(hi-low),
+                    bound=sympy.latex(bound), shift=sympy.latex(shift),
+                    lcomp=lcomp,gcomp=gcomp, inside=sympy.latex(inside)
                 )
             
         if self.full_simplify:
-            scale, inside = inside.clear_denoms(convert=True)
+            scale, inside, bound = self.simplified
             if scale != 1:
-                bound = bound * scale
                 simplify = r'''This can be simplified by multiplying
                 through by the denominator of the right-hand side
                 \[
                 \abs{{{inside}}} {comp} {bound}.
                 \]
                 '''.format(
-                    inside=latex(inside), comp=comp, bound=latex(bound))
+                    inside=sympy.latex(inside), comp=comp,
+                    bound=sympy.latex(bound))
                 soln = ''.join([soln, simplify])
 
         return soln
 
+
+class SimplifiedRevAbsValProb(RevAbsValProb):
+    '''A reverse absolute-value problem whose answer is scaled to clear the
+    denominators.'''
+
+    printable = False
+    full_simplify = True
+
+
 def main():
     import ConfigParser
     config = ConfigParser.ConfigParser()
@@ -303,9 +351,12 @@ def main():
 
     print r'\begin{enumerate}'
 
-    full_simplify = config.getboolean('RevAbsValProb', 'full_simplify')
+    if config.getboolean('RevAbsValProb', 'full_simplify'):
+        probtype = SimplifiedRevAbsValProb
+    else:
+        probtype = RevAbsValProb
     for i in xrange(10):
-        prob = RevAbsValProb(full_simplify=full_simplify)
+        prob = probtype()
         print r'\item', prob.statement
         if config.getboolean('RevAbsValProb', 'solutions'):
             print prob.solution
@@ -0,0 +1,249 @@
+'''Precomputed banks of every problem of the small problem types.
+
+A problem type with a `space` and `bank_options` can have all of its
+problems rendered ahead of time into a bank file: a header, a table of
+offsets, and the statement, answer and solution of each problem in the
+order of its key index.  Banks are memory-mapped, so drawing a problem is a
+lookup that needs neither sympy nor any rendering, and worker processes
+forked after a bank is opened share its pages.
+
+Each bank records a hash of the source of the modules its problems are
+generated by (their bytecode, in a frozen build without the source) and of
+the sympy version, and is rebuilt when that changes.  Build them all ahead of
+time with
+
+    python geckomodules/bank.py [--force]
+'''
+
+import argparse
+import collections
+import hashlib
+import imp
+import logging
+import marshal
+import mmap
+import os
+import pkgutil
+import struct
+import sys
+import tempfile
+import types
+
+from lazyimport import sympy
+
+BANK_DIR = os.path.join(os.path.expanduser('~'), '.geckomath', 'banks')
+
+# magic, source version, number of problems
+HEADER = struct.Struct('<8s40sQ')
+OFFSET = struct.Struct('<Q')
+MAGIC = 'GECKOBNK'
+SEPARATOR = '\0'
+
+Record = collections.namedtuple('Record',
+                                ['key', 'statement', 'answer', 'solution'])
+
+_banks = {}
+# the version of each bank, worked out once per process: the modules can't
+# change under a running process
+_versions = {}
+
+
+def _source_modules(module):
+    '''`module` and the modules next to it that it uses.'''
+    directory = os.path.dirname(os.path.abspath(module.__file__))
+    modules = set([module])
+    for value in vars(module).values():
+        if not isinstance(value, types.ModuleType):
+            value = sys.modules.get(getattr(value, '__module__', None))
+        if value is not None and hasattr(value, '__file__'):
+            if os.path.dirname(os.path.abspath(value.__file__)) == directory:
+                modules.add(value)
+    return sorted(modules, key=lambda dependency: dependency.__name__)
+
+
+def _module_code(module):
+    '''The source of `module`, or its bytecode if the source isn't there, as
+    in the py2exe build.'''
+    path = os.path.abspath(module.__file__)
+    if path.endswith(('.pyc', '.pyo')):
+        path = path[:-1]
+    try:
+        with open(path, 'rb') as source:
+            return source.read()
+    except IOError:
+        code = pkgutil.get_loader(module).get_code(module.__name__)
+        return marshal.dumps(code)
+
+
+def _sympy_version():
+    '''The version of sympy, read from its release file where there is one,
+    so that opening a bank doesn't import all of sympy.'''
+    try:
+        _, path, _ = imp.find_module('sympy')
+        with open(os.path.join(path, 'release.py')) as release:
+            namespace = {}
+            exec release.read() in namespace
+        return namespace['__version__']
+    except (ImportError, IOError, KeyError):
+        return sympy.__version__
+
+
+def bank_version(cls, options):
+    '''A hash of everything that the problems in a bank depend on.'''
+    name = (cls, tuple(sorted(options.items())))
+    version = _versions.get(name)
+    if version is None:
+        digest = hashlib.sha1(cls.__name__)
+        digest.update(repr(sorted(options.items())))
+        digest.update(_sympy_version())
+        for module in _source_modules(sys.modules[cls.__module__]):
+            digest.update(_module_code(module))
+        version = _versions[name] = digest.hexdigest()
+    return version
+
+
+def bank_path(cls, options):
+    '''Where the bank of `cls` built with `options` lives.'''
+    name = '-'.join([cls.__name__] + ['{}={}'.format(option, value)
+                                      for option, value
+                                      in sorted(options.items())])
+    return os.path.join(BANK_DIR, name + '.bank')
+
+
+def _encode(text):
+    if isinstance(text, unicode):
+        return text.encode('utf-8')
+    return str(text)
+
+
+def build_bank(cls, options, path, version):
+    '''Render every problem of `cls` into a new bank file at `path`.'''
+    logging.info('building the %s bank %s', cls.__name__, path)
+    space = cls.space
+    offsets = [0]
+    records = []
+    for index in xrange(space.size):
+        prob = cls(key=space.key(index), **options)
+        record = SEPARATOR.join(_encode(field) for field in
+                                (prob.statement, prob.answer, prob.solution))
+        records.append(record)
+        offsets.append(offsets[-1] + len(record))
+
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    handle, tmppath = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as bankfile:
+            bankfile.write(HEADER.pack(MAGIC, version, space.size))
+            for offset in offsets:
+                bankfile.write(OFFSET.pack(offset))
+            for record in records:
+                bankfile.write(record)
+        os.rename(tmppath, path)
+    except:
+        os.remove(tmppath)
+        raise
+
+
+class ProblemBank(object):
+    '''A read-only, memory-mapped bank file.'''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as bankfile:
+            self._map = mmap.mmap(bankfile.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        magic, self.version, self.size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('{} is not a problem bank'.format(path))
+        self._data = HEADER.size + OFFSET.size * (self.size + 1)
+
+    def __len__(self):
+        return self.size
+
+    def fields(self, index):
+        '''The (statement, answer, solution) of problem number `index`.'''
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        position = HEADER.size + OFFSET.size * index
+        start, = OFFSET.unpack_from(self._map, position)
+        end, = OFFSET.unpack_from(self._map, position + OFFSET.size)
+        return tuple(self._map[self._data + start:self._data + end].split(
+            SEPARATOR))
+
+    def close(self):
+        self._map.close()
+
+
+def load_bank(cls, options=None, build=True):
+    '''The bank of `cls` built with `options`, built first if it is missing
+    or out of date.  Returns None if there is no up-to-date bank and
+    `build` is false.  A bank is only checked against the source when it
+    is opened; after that it is kept open for the rest of the process.'''
+    options = options or {}
+    name = (cls, tuple(sorted(options.items())))
+    bank = _banks.get(name)
+    if bank is not None:
+        return bank
+
+    version = bank_version(cls, options)
+    path = bank_path(cls, options)
+    try:
+        bank = ProblemBank(path)
+    except (IOError, ValueError, struct.error):
+        bank = None
+    if bank is not None and bank.version != version:
+        bank.close()
+        bank = None
+
+    if bank is None:
+        if not build:
+            return None
+        build_bank(cls, options, path, version)
+        bank = ProblemBank(path)
+
+    _banks[name] = bank
+    return bank
+
+
+def banked_types(probtypes):
+    '''The problem types in `probtypes` that can be banked.'''
+    return [cls for cls in probtypes
+            if cls.space is not None and cls.bank_options is not None]
+
+
+def load_banks(probtypes):
+    '''Open (building as needed) the banks that worksheets of the types in
+    `probtypes` are drawn from.'''
+    for cls in banked_types(probtypes):
+        if {} in cls.bank_options:
+            load_bank(cls)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build the problem banks of the small problem types.')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='rebuild banks even if they are up to date')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    from geckomodules import plugins
+    probtypes = [probtype.load() for probtype in plugins.probtypes()]
+
+    for cls in banked_types(probtypes):
+        for options in cls.bank_options:
+            if args.force:
+                build_bank(cls, options, bank_path(cls, options),
+                           bank_version(cls, options))
+            bank = load_bank(cls, options)
+            print '{:<24} {:>6} problems  {}'.format(cls.__name__, len(bank),
+                                                     bank.path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+'''Exact integer arithmetic and TeX output for binomial problems.
+
+Every binomial problem is about (ax + b)^c with integer a, b and c, so the
+expanded coefficients come straight from Pascal's triangle and there is no
+need for a computer algebra system.  Polynomials are lists of integer
+coefficients indexed by the power of x, and `latex_poly` prints them exactly
+as `sympy.latex` prints the same polynomial expression.
+'''
+
+# rows of Pascal's triangle computed so far; row n holds C(n, 0)..C(n, n)
+_PASCAL = [[1]]
+
+
+def pascal_row(n):
+    '''Row n of Pascal's triangle.'''
+    while len(_PASCAL) <= n:
+        prev = _PASCAL[-1]
+        _PASCAL.append([1] + [prev[k] + prev[k + 1]
+                              for k in xrange(len(prev) - 1)] + [1])
+    return _PASCAL[n]
+
+
+def binomial(n, k):
+    '''The binomial coefficient C(n, k).'''
+    return pascal_row(n)[k]
+
+
+def powers(base, n):
+    '''The list [base**0, base**1, ..., base**n].'''
+    result = [1] * (n + 1)
+    for k in xrange(1, n + 1):
+        result[k] = result[k - 1] * base
+    return result
+
+
+def expand(a, b, c):
+    '''The coefficients of (ax + b)^c, indexed by the power of x.'''
+    row = pascal_row(c)
+    apow = powers(a, c)
+    bpow = powers(b, c)
+    return [row[k] * apow[k] * bpow[c - k] for k in xrange(c + 1)]
+
+
+def latex_term(coeff, power, var='x'):
+    '''TeX for the single term coeff * var**power, as sympy prints it.'''
+    if power == 0:
+        return str(coeff)
+
+    if power == 1:
+        monomial = var
+    else:
+        monomial = '{var}^{{{power}}}'.format(var=var, power=power)
+
+    if coeff == 1:
+        return monomial
+    elif coeff == -1:
+        return '- ' + monomial
+    elif coeff < 0:
+        return '- {} {}'.format(-coeff, monomial)
+    else:
+        return '{} {}'.format(coeff, monomial)
+
+
+def latex_poly(coeffs, var='x'):
+    '''TeX for the polynomial with the given coefficients.
+
+    The output matches `sympy.latex` of the polynomial's expression: terms
+    in decreasing powers, except that a positive constant and one negative
+    term are written constant first (`5 - 2 x`).
+    '''
+    terms = [(power, coeff)
+             for power, coeff in reversed(list(enumerate(coeffs))) if coeff]
+    if not terms:
+        return '0'
+
+    if (len(terms) == 2 and terms[1][0] == 0
+            and terms[1][1] > 0 and terms[0][1] < 0):
+        terms.reverse()
+
+    power, coeff = terms[0]
+    tex = [latex_term(coeff, power, var)]
+    for power, coeff in terms[1:]:
+        if coeff < 0:
+            tex.append(' - ')
+            tex.append(latex_term(-coeff, power, var))
+        else:
+            tex.append(' + ')
+            tex.append(latex_term(coeff, power, var))
+
+    return ''.join(tex)
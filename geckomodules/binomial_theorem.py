@@ -1,16 +1,7 @@
-import random
+import binomial_engine
+from Problems import ParamSpace, Problem, derived
 
-from sympy import *
-x = symbols('x')
-
-from Problems import Problem
-
-def nonzero_randrange(start, stop):
-    retval = 0
-    while retval == 0:
-        retval = random.randrange(start, stop)
-
-    return retval
+NONZERO = [value for value in xrange(-6, 6) if value]
 
 
 def ordinal(value):
@@ -68,13 +59,16 @@ class BinomProb(Problem):
     
     In general, binomial problems deal with polynomials of the form (a + b)^c.'''
 
-    def __init__(self):
-        super(BinomProb, self).__init__()
-        self.a = nonzero_randrange(-6,6)
-        self.b = nonzero_randrange(-6,6)
-        self.c = nonzero_randrange(2, 10)
-        self.poly = Poly((self.a * x + self.b)**self.c, x)
-        self.inner = Poly(self.a * x + self.b, x)
+    space = ParamSpace(('a', NONZERO), ('b', NONZERO), ('c', xrange(2, 10)))
+
+    @derived
+    def coeffs(self):
+        '''The expanded coefficients, indexed by the power of x.'''
+        return binomial_engine.expand(self.a, self.b, self.c)
+
+    @derived
+    def inner(self):
+        return binomial_engine.latex_poly([self.b, self.a])
 
 class BinomExpProb(BinomProb):
     '''A binomial expansion problem.
@@ -85,14 +79,17 @@ class BinomExpProb(BinomProb):
     printable = True
     secname = 'Binomial Expansion Problems'
 
-    def __init__(self, variables=1):
-        super(BinomExpProb, self).__init__()
-        self.statement = r'''Expand $\left({inner}\right)^{{{c}}}$.'''.format(
-            inner=latex(self.inner), c=self.c
+    @derived
+    def statement(self):
+        return r'''Expand $\left({inner}\right)^{{{c}}}$.'''.format(
+            inner=self.inner, c=self.c
         )
-        self.answer = r'''${}$'''.format(latex(self.poly))
 
-    @property
+    @derived
+    def answer(self):
+        return r'''${}$'''.format(binomial_engine.latex_poly(self.coeffs))
+
+    @derived
     def solution(self):
 
         terms = [ 
@@ -106,11 +103,14 @@ class BinomExpProb(BinomProb):
             for i in xrange(self.c/3 + 1)
         ])
 
+        binterms = binomial_engine.pascal_row(self.c)
+        apowers = binomial_engine.powers(self.a, self.c)
+        bpowers = binomial_engine.powers(self.b, self.c)
         terms2 = [ 
             r'''({binterm})({aterm})({bterm})'''.format(
-                binterm=latex(binomial(self.c, index)), aterm =
-                latex(Poly((self.a * x)**index, x)), bterm =
-                latex(Poly(self.b**(self.c - index), x))) 
+                binterm=binterms[index], aterm =
+                binomial_engine.latex_term(apowers[index], index), bterm =
+                bpowers[self.c - index]) 
             for index in xrange(self.c + 1)]
 
         expanded2 = r'''\\
@@ -119,7 +119,7 @@ class BinomExpProb(BinomProb):
             for i in xrange(self.c/3 + 1)
         ])
 
-        terms3 = [latex(Poly(self.poly.nth(index) * x**index, x)) 
+        terms3 = [binomial_engine.latex_term(self.coeffs[index], index) 
                   for index in xrange(self.c + 1)] 
 
         expanded3 = r'''\\
@@ -135,7 +135,7 @@ class BinomExpProb(BinomProb):
                                          &= {expanded3}
             \end{{align*}}
             '''.format(
-                inner=latex(self.inner), c=self.c, expanded=expanded,
+                inner=self.inner, c=self.c, expanded=expanded,
                 expanded2=expanded2, expanded3=expanded3, 
             )
 
@@ -150,16 +150,24 @@ class BinomNthTermProb(BinomProb):
 
     printable = True
     secname = 'Binomial Expansion Problems'
-
-    def __init__(self):
-        super(BinomNthTermProb, self).__init__()
-        self.n = random.randrange(self.c + 1)
-        self.statement = r'''Find the coefficient of $x^{{{n}}}$ in the
+    space = ParamSpace(
+        ('a', NONZERO),
+        ('b', NONZERO),
+        (('c', 'n'), [(c, n) for c in xrange(2, 10) for n in xrange(c + 1)]),
+    )
+    bank_options = ({},)
+
+    @derived
+    def statement(self):
+        return r'''Find the coefficient of $x^{{{n}}}$ in the
         expansion of $({inner})^{{{c}}}$.
-        '''.format(n=self.n, inner=latex(self.inner), c=self.c)
-        self.answer = self.poly.nth(self.n)
+        '''.format(n=self.n, inner=self.inner, c=self.c)
+
+    @derived
+    def answer(self):
+        return self.coeffs[self.n]
 
-    @property
+    @derived
     def solution(self):
         ans = r'''The {nth} term of a binomial expansion is given by
         \[
@@ -169,9 +177,11 @@ class BinomNthTermProb(BinomProb):
         \]
         '''.format(
             nth=ordinal(self.n), c=self.c, n=self.n, a=self.a, b=self.b,
-            k=(self.c - self.n), binterm=latex(binomial(self.c, self.n)),
-            aterm=latex(Poly((self.a * x)**self.n, x)),
-            bterm=latex(Poly(self.b**(self.c - self.n), x)), soln=self.answer
+            k=(self.c - self.n),
+            binterm=binomial_engine.binomial(self.c, self.n),
+            aterm=binomial_engine.latex_term(self.a**self.n, self.n),
+            bterm=self.b**(self.c - self.n),
+            soln=self.answer
         )
 
         return ans
@@ -185,16 +195,22 @@ class BinomContractProb(BinomProb):
 
     printable = True
     secname = 'Binomial Expansion Problems'
-
-    def __init__(self):
-        super(BinomContractProb, self).__init__()
-        self.a = nonzero_randrange(0, 6)
-        self.statement = r'''Express ${poly}$ in the form $(ax + b)^{{n}}$.
-            '''.format(poly=latex(self.poly))
-        self.answer = r'''$({inner})^{{{c}}}$'''.format(
-            inner=latex(self.inner), c=self.c)
-
-    @property
+    # a is positive, so that the expression is unique
+    space = ParamSpace(('a', xrange(1, 6)), ('b', NONZERO),
+                       ('c', xrange(2, 10)))
+    bank_options = ({},)
+
+    @derived
+    def statement(self):
+        return r'''Express ${poly}$ in the form $(ax + b)^{{n}}$.
+            '''.format(poly=binomial_engine.latex_poly(self.coeffs))
+
+    @derived
+    def answer(self):
+        return r'''$({inner})^{{{c}}}$'''.format(
+            inner=self.inner, c=self.c)
+
+    @derived
     def solution(self):
         if self.b < 0:
             are = 'are'
@@ -217,10 +233,10 @@ class BinomContractProb(BinomProb):
             \]
             So the polynomial can be written as {ANS}.
             '''.format(
-                LT='{LC}x^{{{c}}}'.format(LC=self.poly.LC(), c=self.c),
-                LPOW=self.poly.degree(), c=self.c, ARE=are, POSNEG=posneg,
-                ORD=ordinal(self.c), ALC=abs(self.poly.LC()), DEG=deg,
-                a=abs(self.a), ABSP=absp, CONST=abs(self.poly.TC()),
+                LT='{LC}x^{{{c}}}'.format(LC=self.coeffs[-1], c=self.c),
+                LPOW=len(self.coeffs) - 1, c=self.c, ARE=are, POSNEG=posneg,
+                ORD=ordinal(self.c), ALC=abs(self.coeffs[-1]), DEG=deg,
+                a=abs(self.a), ABSP=absp, CONST=abs(self.coeffs[0]),
                 b=abs(self.b), ANS=self.answer
             ) 
 
@@ -0,0 +1,70 @@
+'''Structured timing events from the hot paths of worksheet generation.
+
+Code that does something worth timing calls `emit` with an event name and
+some fields.  Events go to every registered sink, which is any callable
+that takes the event as a dict.  With no sinks registered `emit` returns at
+once, and callers that would need extra work to time something check
+`enabled()` first, so instrumentation costs next to nothing when it is off.
+
+    instrumentation.add_sink(instrumentation.JSONLinesSink(open(path, 'a')))
+'''
+
+import json
+import os
+import threading
+import time
+
+_sinks = []
+
+
+def enabled():
+    '''Whether any sink is listening.'''
+    return bool(_sinks)
+
+
+def add_sink(sink):
+    '''Send every event to `sink` from now on.'''
+    _sinks.append(sink)
+
+
+def remove_sink(sink):
+    _sinks.remove(sink)
+
+
+def emit(event, **fields):
+    '''Send an event with the given fields to every sink.
+
+    Every event also records its name, the time and the process id, so
+    events from the workers of a batch can be told apart.
+    '''
+    if not _sinks:
+        return
+    fields.update(event=event, time=time.time(), pid=os.getpid())
+    for sink in list(_sinks):
+        sink(fields)
+
+
+class JSONLinesSink(object):
+    '''Write each event as a line of JSON to a file.
+
+    Every event is written with a single call and flushed straight away, so
+    processes that share a file opened for appending don't interleave their
+    lines.
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event, sort_keys=True) + '\n'
+        with self._lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+
+class Collector(list):
+    '''A sink that keeps every event in a list.'''
+
+    def __call__(self, event):
+        self.append(event)
@@ -0,0 +1,22 @@
+import importlib
+
+
+class LazyModule(object):
+    '''A stand-in for a module that is only imported when first used.
+
+    Problem modules use this for heavy dependencies, so that loading the GUI
+    or the command line doesn't wait on them until a problem that needs them
+    is actually generated.
+    '''
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, attr):
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+        return getattr(self.__module, attr)
+
+
+sympy = LazyModule('sympy')
@@ -0,0 +1,143 @@
+'''The problem types, listed without importing the modules they live in.
+
+Problem types register themselves in `Problems.PROBTYPES` as their modules
+are imported, so listing them that way means importing every problem
+module.  Instead, the manifest `plugins.json` next to this module lists
+every problem class in the modules named in `geckomodules.__all__`: its
+module, class name, `secname` and whether it is `printable`.  A type's
+module is only imported when `ProbType.load()` is called for it.
+
+The manifest is generated at build time,
+
+    python geckomodules/plugins.py
+
+and is generated again on first use if it is missing or any module in
+`geckomodules` is newer than it.
+'''
+
+import collections
+import importlib
+import json
+import logging
+import os
+import sys
+
+FIELDS = ['module', 'name', 'secname', 'printable']
+
+if getattr(sys, 'frozen', False):
+    # a py2exe build ships the manifest next to the executable
+    MANIFEST = os.path.join(os.path.dirname(sys.executable), 'geckomodules',
+                            'plugins.json')
+else:
+    MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'plugins.json')
+
+_manifest = None
+_probtypes = None
+
+
+class ProbType(collections.namedtuple('ProbType', FIELDS)):
+    '''A problem type as the manifest lists it.'''
+    __slots__ = ()
+
+    def load(self):
+        '''Import the type's module and return the problem class.'''
+        return getattr(importlib.import_module(self.module), self.name)
+
+
+def build_manifest():
+    '''Import every problem module and list the problem types they define,
+    in the order they register.'''
+    import geckomodules
+    from geckomodules import Problems
+
+    modules = ['geckomodules.' + name for name in geckomodules.__all__
+               if name != 'Problems']
+    for module in modules:
+        importlib.import_module(module)
+    classes = [cls for cls in Problems.REGISTRY if cls.__module__ in modules]
+    classes.sort(key=lambda cls: modules.index(cls.__module__))
+    return [ProbType(cls.__module__, cls.__name__,
+                     getattr(cls, 'secname', cls.__name__),
+                     bool(cls.printable))
+            for cls in classes]
+
+
+def write_manifest(path=MANIFEST):
+    '''Build the manifest and save it to `path`; returns it.'''
+    manifest = build_manifest()
+    with open(path, 'w') as manifest_file:
+        json.dump({'types': [entry._asdict() for entry in manifest]},
+                  manifest_file, indent=1, separators=(',', ': '))
+        manifest_file.write('\n')
+    return manifest
+
+
+def _stale(path):
+    '''Whether any module source next to `path` is newer than it.'''
+    built = os.path.getmtime(path)
+    directory = os.path.dirname(path)
+    return any(os.path.getmtime(os.path.join(directory, filename)) > built
+               for filename in os.listdir(directory)
+               if filename.endswith('.py'))
+
+
+def _str(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def read_manifest(path=MANIFEST):
+    '''The manifest saved at `path`, or None if it is missing or stale.'''
+    try:
+        if _stale(path):
+            return None
+        with open(path) as manifest_file:
+            entries = json.load(manifest_file)['types']
+        return [ProbType(**dict((field, _str(value))
+                                for field, value in entry.items()))
+                for entry in entries]
+    except (OSError, IOError, ValueError, KeyError, TypeError):
+        return None
+
+
+def manifest():
+    '''Every problem type, printable or not.'''
+    global _manifest
+    if _manifest is None:
+        _manifest = read_manifest()
+    if _manifest is None:
+        try:
+            _manifest = write_manifest()
+        except (OSError, IOError):
+            logging.debug('cannot save the plugin manifest', exc_info=True)
+            _manifest = build_manifest()
+    return _manifest
+
+
+def probtypes():
+    '''The printable problem types, in the order worksheets list them.
+
+    The same list is returned every time, so sorting it changes the order
+    of the sections on every worksheet made afterwards.
+    '''
+    global _probtypes
+    if _probtypes is None:
+        _probtypes = [entry for entry in manifest() if entry.printable]
+    return _probtypes
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    for entry in write_manifest():
+        print '{:<32} {:<20} {:<6} {}'.format(entry.module, entry.name,
+                                              str(entry.printable),
+                                              entry.secname)
+    print 'manifest written to', MANIFEST
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+'''A pool of problems made ahead of time, for an interactive front end.
+
+Someone clicking "Generate" over and over until they like a worksheet
+shouldn't wait for every problem to be built from scratch each time.  A
+`ProblemPool` keeps a few ready-made problems of each type, with the fields
+a worksheet prints already rendered, and a background thread tops it up
+whenever it is running low and isn't paused.
+
+    problem_pool = pool.ProblemPool()
+    problem_pool.configure(entry, 5, solutions=True)
+    problem_pool.start()
+    ...
+    problems = problem_pool.take(entry, 5, solutions=True)
+
+Problem types are given as `plugins.ProbType` entries, so a type's module
+is only imported once the pool starts making problems of it.
+'''
+
+import collections
+import logging
+import threading
+import time
+
+from Problems import MAX_REDRAWS
+
+# How long to leave a type alone after making a problem of it failed.
+RETRY_SECONDS = 5
+
+
+def _render(prob, solutions):
+    '''Render the fields of `prob` that a worksheet prints.'''
+    prob.statement
+    if solutions:
+        prob.solution
+    else:
+        prob.answer
+    return prob
+
+
+class ProblemPool(object):
+    '''Ready-made problems of each problem type.
+
+    `configure` sets how many problems of a type to keep and whether they
+    show full solutions; changing the depth throws away the problems made
+    for the old one.  No two problems of a type in the pool are alike, and
+    `take` hands out problems for a worksheet, making any that are missing
+    on the spot.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._problems = {}
+        self._settings = {}
+        self._repeats = collections.Counter()
+        # when each type that failed may be tried again
+        self._retry = {}
+        self._paused = False
+        self._stopped = False
+        self._thread = threading.Thread(target=self._fill)
+        self._thread.daemon = True
+
+    def configure(self, entry, size, solutions):
+        '''Keep `size` problems of the type `entry`, with or without full
+        `solutions`.'''
+        with self._lock:
+            old = self._settings.get(entry)
+            problems = self._problems.get(entry)
+            if old is None or old[1] != solutions:
+                problems = self._problems[entry] = collections.deque()
+            while len(problems) > size:
+                problems.pop()
+            self._settings[entry] = (size, solutions)
+            self._retry.pop(entry, None)
+            self._lock.notify()
+
+    def start(self):
+        '''Start filling the pool in the background.'''
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._lock.notify()
+
+    def pause(self):
+        '''Stop filling the pool until `resume()`, so that the work a caller
+        is waiting for gets the processor.'''
+        with self._lock:
+            self._paused = True
+
+    def resume(self):
+        with self._lock:
+            self._paused = False
+            self._lock.notify()
+
+    def missing(self):
+        '''How many problems the pool is short of, in all.'''
+        with self._lock:
+            return sum(size - len(self._problems[entry])
+                       for entry, (size, _) in self._settings.items())
+
+    def take(self, entry, count, solutions):
+        '''`count` different problems of the type `entry`, from the pool as
+        far as it goes.'''
+        taken = []
+        with self._lock:
+            problems = self._problems.get(entry)
+            if problems and self._settings[entry][1] == solutions:
+                while problems and len(taken) < count:
+                    taken.append(problems.popleft())
+            self._lock.notify()
+
+        if len(taken) < count:
+            probtype = entry.load()
+            keys = set(prob.key for prob in taken)
+            # draw again for as long as the fresh problems collide with the
+            # pool's
+            for _ in xrange(MAX_REDRAWS):
+                for prob in probtype.draw_unique(count):
+                    if prob.key in keys:
+                        continue
+                    keys.add(prob.key)
+                    taken.append(_render(prob, solutions))
+                    if len(taken) == count:
+                        return taken
+            logging.warning('%s: no new problem in %d draws; repeating some',
+                            entry.name, MAX_REDRAWS)
+            for prob in probtype.draw_unique(count - len(taken)):
+                taken.append(_render(prob, solutions))
+        return taken
+
+    def _next_wanted(self):
+        '''The type furthest below its size and its depth, or None, and
+        how long until a type that failed may be tried again, or None.'''
+        shortest, wanted, wait = None, 0, None
+        now = time.time()
+        for entry, (size, solutions) in self._settings.items():
+            short = size - len(self._problems[entry])
+            if short <= 0:
+                continue
+            retry = self._retry.get(entry, now)
+            if retry > now:
+                if wait is None or retry - now < wait:
+                    wait = retry - now
+            elif short > wanted:
+                shortest, wanted = (entry, solutions), short
+        return shortest, wait
+
+    def _fill(self):
+        while True:
+            with self._lock:
+                while True:
+                    if self._stopped:
+                        return
+                    wanted, wait = None, None
+                    if not self._paused:
+                        wanted, wait = self._next_wanted()
+                    if wanted is not None:
+                        break
+                    self._lock.wait(wait)
+            entry, solutions = wanted
+
+            try:
+                probtype = entry.load()
+                prob = _render(next(probtype.draw_unique(1)), solutions)
+            except Exception:
+                logging.exception('%s: filling the problem pool failed; '
+                                  'trying again in %ds', entry.name,
+                                  RETRY_SECONDS)
+                with self._lock:
+                    # don't retry in a tight loop
+                    self._retry[entry] = time.time() + RETRY_SECONDS
+                continue
+
+            with self._lock:
+                problems = self._problems[entry]
+                size, current = self._settings[entry]
+                if probtype.space is not None and size > probtype.space.size:
+                    # there aren't enough different problems to fill it
+                    size = probtype.space.size
+                    self._settings[entry] = (size, current)
+                if current != solutions or len(problems) >= size:
+                    continue
+                if any(prob.key == other.key for other in problems):
+                    # like draw_unique, give up on finding a new one after
+                    # a while
+                    self._repeats[entry] += 1
+                    if self._repeats[entry] < MAX_REDRAWS:
+                        continue
+                self._repeats[entry] = 0
+                problems.append(prob)
@@ -2,11 +2,12 @@ from __future__ import division
 
 import collections
 import fractions
-import logging
-import random
+import math
 
 
-from Problems import Problem
+from Problems import ParamSpace, Problem, derived
+from sampling import bounded_composition, composition
+from venn import Venn, format_template
 
 Condition = collections.namedtuple('Condition', ['sing', 'plural'])
 
@@ -58,23 +59,33 @@ class TwoVarChanceProb(Problem):
     probtypes = [
         (['U', 'A', 'B', 'AB'], 'A-B')
     ]
-
-    def __init__(self):
-        super(TwoVarChanceProb, self).__init__()
-        self.scenario = random.choice(SCENARIOS)
+    # scenario, probtype and the two conditions are indices into SCENARIOS,
+    # probtypes and the scenario's conditions
+    params = ('scenario_index', 'A', 'B', 'AB', 'probtype_index',
+              'condA_index', 'condB_index')
+
+    def __init__(self, rng=None, key=None):
+        super(TwoVarChanceProb, self).__init__(rng, key)
+        self.scenario = SCENARIOS[self.scenario_index]
         self.U = self.scenario['scale']
-        onlyA = random.randrange(self.U)
-        onlyB = random.randrange(self.U - onlyA)
-        both = random.randrange(self.U - onlyA - onlyB)
-        self.A = onlyA + both
-        self.B = onlyB + both
-        self.AB = both
-
-        self.givens, self.to_find = random.choice(self.probtypes)
-
-        self.condA, self.condB = random.sample(self.scenario['conditions'], 2)
-
-    @property
+        self.givens, self.to_find = self.probtypes[self.probtype_index]
+        conditions = self.scenario['conditions']
+        self.condA = conditions[self.condA_index]
+        self.condB = conditions[self.condB_index]
+
+    @classmethod
+    def sample(cls, rng):
+        scenario = rng.randrange(len(SCENARIOS))
+        # split everyone into A only, B only, both and neither
+        onlyA, onlyB, both, _ = composition(
+            rng, SCENARIOS[scenario]['scale'], 4, minimum=1)
+        probtype = rng.randrange(len(cls.probtypes))
+        condA, condB = rng.sample(
+            xrange(len(SCENARIOS[scenario]['conditions'])), 2)
+        return (scenario, onlyA + both, onlyB + both, both, probtype, condA,
+                condB)
+
+    @derived
     def statement(self):
         givens = [
             ' are '.join([
@@ -135,7 +146,7 @@ class TwoVarChanceProb(Problem):
 
         return statement
 
-    @property
+    @derived
     def answer(self):
         return '{}\%'.format(
             self.to_find.replace(
@@ -155,7 +166,7 @@ class TwoVarChanceProb(Problem):
             )
         )
 
-    @property
+    @derived
     def solution(self):
         return ''
 
@@ -166,18 +177,12 @@ class TwoUrnProb(Problem):
     '''
     printable = True
     secname = 'P4-type'
+    params = ('red1', 'blue1', 'red2', 'blue2')
 
-    def __init__(self):
-        super(TwoUrnProb, self).__init__()
-        # XXX: is this a good limit? should we even /have/ a limit?
-        limit = 20 
-        red = (random.randrange(1,21), random.randrange(1,21))
-        self.urns = [
-            {'red' : red[0],
-             'blue' : min(random.randrange(1,21), limit - red[0])},
-            {'red' : red[1],
-             'blue' : min(random.randrange(1,21), limit - red[1])}
-        ]
+    def __init__(self, rng=None, key=None):
+        super(TwoUrnProb, self).__init__(rng, key)
+        self.urns = [{'red': self.red1, 'blue': self.blue1},
+                     {'red': self.red2, 'blue': self.blue2}]
         for i in (0,1):
             self.urns[i]['total'] = self.urns[i]['red'] + self.urns[i]['blue']
 
@@ -194,9 +199,16 @@ class TwoUrnProb(Problem):
         self.prob_both_blue = self.pblue[0] * self.pblue[1]
         self.prob_same = self.prob_both_red + self.prob_both_blue
 
+    @classmethod
+    def sample(cls, rng):
+        # XXX: is this a good limit? should we even /have/ a limit?
+        limit = 20 
+        key = ()
+        for _ in (0, 1):
+            key += bounded_composition(rng, limit, 2, minimum=1)
+        return key
 
-
-    @property
+    @derived
     def statement(self):
         text = r'''An urn contains {LTOT} balls: {LRED} {RED} and {LBLUE}
         {BLUE}.  A second urn contains {RRED} {RED} balls and an unknown number
@@ -213,7 +225,7 @@ class TwoUrnProb(Problem):
 
         return text
 
-    @property
+    @derived
     def solution(self):
         text=r'''Since we're given all of the details of the first urn, we can
         calculate the probability of each color being drawn from the first urn:
@@ -331,29 +343,46 @@ class NofMProb(Problem):
         }
     ,)
 
-    def __init__(self, n=2, m=3, max_denominator=20):
-        super(NofMProb, self).__init__()
-        
-        self.flavor = random.choice(self.flavors)
+    # how many people chose A, B and C, and how many chose none of them
+    params = ('flavor_index', 'chose_A', 'chose_B', 'chose_C', 'chose_none')
+    # the most people that may be asked
+    max_denominator = 20
+
+    def __init__(self, rng=None, key=None):
+        super(NofMProb, self).__init__(rng, key)
+
+        self.flavor = self.flavors[self.flavor_index]
+        # each person who chose made two choices
+        people = self.chose_none + (self.chose_A + self.chose_B
+                                    + self.chose_C) // 2
+        self.propA = fractions.Fraction(self.chose_A, people)
+        self.propB = fractions.Fraction(self.chose_B, people)
+        self.propC = fractions.Fraction(self.chose_C, people)
+        self.propNone = fractions.Fraction(self.chose_none, people)
+
+    @classmethod
+    def sample(cls, rng):
+        flavor = rng.randrange(len(cls.flavors))
         choices = collections.defaultdict(int)
-        choices['None'] = random.randrange(1,max_denominator)
-        for person in xrange(max_denominator - choices['None']):
-            for choice in random.sample(('A', 'B', 'C'), 2):
+        choices['None'] = rng.randrange(1, cls.max_denominator)
+        for person in xrange(cls.max_denominator - choices['None']):
+            for choice in rng.sample(('A', 'B', 'C'), 2):
                 choices[choice] += 1
+        return (flavor, choices['A'], choices['B'], choices['C'],
+                choices['None'])
 
-        self.propA = fractions.Fraction(choices['A'],max_denominator)
-        self.propB = fractions.Fraction(choices['B'],max_denominator)
-        self.propC = fractions.Fraction(choices['C'],max_denominator)
-        self.propNone = fractions.Fraction(choices['None'],max_denominator)
-
-        self.statement = self.flavor['statement'].format(
+    @derived
+    def statement(self):
+        return self.flavor['statement'].format(
             PROPA=latex(self.propA), PROPB=latex(self.propB),
             PROPC=latex(self.propC)
         )
 
-        self.answer = latex(self.propNone)
+    @derived
+    def answer(self):
+        return latex(self.propNone)
 
-    @property
+    @derived
     def solution(self):
 
         gcd = reduce(fractions.gcd, 
@@ -380,15 +409,28 @@ class ConditionalProb(Problem):
     '''A probability problem for DeMorgan's laws.'''
     printable = True
     secname = 'P7-type'
-    def __init__(self):
-        super(ConditionalProb, self).__init__()
+    # The percentages with exactly one, exactly two and all three risk
+    # factors.  Fewer have one than two, and some have none.
+    space = ParamSpace(
+        (('single', 'double', 'triple'),
+         [(single, double, triple)
+          for double in xrange(1, 30)
+          for single in xrange(1, double)
+          for triple in xrange(1, 10)
+          if 3*single + 3*double + triple < 100]),
+    )
+
+    def __init__(self, rng=None, key=None):
+        super(ConditionalProb, self).__init__(rng, key)
 
         self.probs = {}
-        self.probs['D'] = random.randrange(1, 30) / 100
-        self.probs['S'] = random.randrange(1, self.probs['D']*100) / 100
-        self.probs['T'] = random.randrange(1, 10) / 100
+        self.probs['D'] = self.double / 100
+        self.probs['S'] = self.single / 100
+        self.probs['T'] = self.triple / 100
 
-        self.statement = r'''An actuary is studying the prevalence of three
+    @derived
+    def statement(self):
+        return r'''An actuary is studying the prevalence of three
         health risk factors, denoted by A, B, and C, within a population of
         women.  For each of the three factors, the probability is {SPROB} that
         a woman in the population has only this risk factor (and no others).
@@ -401,12 +443,15 @@ class ConditionalProb(Problem):
             SPROB=self.probs['S'], DPROB=self.probs['D'],
             PPROB=(self.probs['T']/(self.probs['T'] + self.probs['D']))
         )
-        self.answer = (
+
+    @derived
+    def answer(self):
+        return (
             (1-(3*self.probs['S'] + 3*self.probs['D'] + self.probs['T']))/
             (1 - (self.probs['S'] + 2*self.probs['D'] + self.probs['T']))
         )
 
-    @property
+    @derived
     def solution(self):
         text = r'''This Venn Diagram describes the problem:
         \[
@@ -471,7 +516,60 @@ def percent(num):
     'A LaTeX-safe way of outputting a percentage'
     return ''.join([str(int(num * 100)), r'\%'])
 
-class TwoVarProb(Problem):
+def gauss_exceeds(mu, sigma, threshold):
+    '''The probability that a normal variate exceeds `threshold`.'''
+    return 0.5 * math.erfc((threshold - mu) / (sigma * math.sqrt(2)))
+
+# The chance that a survey respondent belongs to any one group.  (This used to
+# be decided one respondent at a time by testing random.gauss(.3, .3) > .5.)
+MEMBERSHIP = gauss_exceeds(.3, .3, .5)
+
+class SurveyProb(Problem):
+    '''A probability problem about overlapping groups of people.
+
+    Each group is named by a letter in `sets`.  A problem type in `ptypes`
+    gives the chance that someone belongs to each group, and its templates
+    can use any `P<expr>` or `PP<expr>` field that `venn.VennValues`
+    understands, e.g. {PPnLAnR} for the percentage in neither L nor R.
+    '''
+    sets = ''
+    ptypes = ()
+    # the index of the ptype, and the region counts of the Venn diagram
+    params = ('ptype_index', 'counts')
+    # the number of people surveyed
+    population = 100
+
+    def __init__(self, rng=None, key=None):
+        super(SurveyProb, self).__init__(rng, key)
+
+        self.ptype = self.ptypes[self.ptype_index]
+        self.venn = Venn(self.sets, self.counts)
+        self.U = self.venn.total
+
+    @classmethod
+    def sample(cls, rng):
+        ptype = rng.randrange(len(cls.ptypes))
+        venn = Venn.sample(cls.sets, cls.ptypes[ptype]['probs'],
+                           cls.population, rng)
+        return ptype, tuple(venn.counts)
+
+    @derived
+    def values(self):
+        return self.venn.values(percent)
+
+    @derived
+    def statement(self):
+        return format_template(self.ptype['statement'], self.values)
+
+    @derived
+    def answer(self):
+        return format_template(self.ptype['answer'], self.values)
+
+    @derived
+    def solution(self):
+        return format_template(self.ptype['solution'], self.values)
+
+class TwoVarProb(SurveyProb):
     '''A two-variable probability problem.
 
     I am having the darndest time doing this synthetically, so I'm just going
@@ -480,6 +578,7 @@ class TwoVarProb(Problem):
     '''
     printable = True
     secname = 'Two Variable Probability'
+    sets = 'LR'
     ptypes = (
         {'statement': r'''The probability that a visit to a primary care
          physician's (PCP) office results in neither lab work nor referral to a
@@ -502,8 +601,7 @@ class TwoVarProb(Problem):
          \]
          So the probability of both is ${PLAR}$.
          ''',
-         'ltest':  lambda: True if random.gauss(.3, .3) > .5 else False,
-         'rtest':  lambda: True if random.gauss(.3, .3) > .5 else False,
+         'probs': (MEMBERSHIP, MEMBERSHIP),
         },
         {'statement': r'''You are given $P(A \cup B) = {PLOR}$ and $P(A \cup
          B') = {PLOnR}$.  Determine $P(A)$.
@@ -520,57 +618,15 @@ class TwoVarProb(Problem):
          Since $P(B) + P(B') = 1$.  Therefore, ${PLOR} + {PLOnR} = P(A) + 1$ so
          that $P(A) = {PL}$.
          ''',
-         'ltest': lambda: True if random.gauss(.3, .3) > .5 else False, 
-         'rtest': lambda: True if random.gauss(.3, .3) > .5 else False, 
+         'probs': (MEMBERSHIP, MEMBERSHIP),
         },
     )
 
-    def __init__(self, U=100):
-
-        self.ptype = random.choice(self.ptypes)
-
-        self.L = set()
-        self.R = set()
-        self.U = set(xrange(U))
-        for entry in self.U:
-            ladd = self.ptype['ltest']()
-            if ladd:
-                self.L.add(entry)
-            radd = self.ptype['rtest']()
-            if radd:
-                self.R.add(entry)
-
-        values = {
-            'PL': len(self.L)/len(self.U), 
-            'PR': len(self.R)/len(self.U),
-            'PnL': len(self.U - self.L)/len(self.U),
-            'PnR': len(self.U - self.R)/len(self.U),
-            'PLAR': len(self.L & self.R)/len(self.U),
-            'PnLAR': len((self.U - self.L) & self.R)/len(self.U),
-            'PLAnR': len(self.L & (self.U - self.R))/len(self.U),
-            'PnLAnR': len((self.U - self.L) & (self.U - self.R))/len(self.U),
-            'PLOR': len(self.L | self.R)/len(self.U),
-            'PnLOR': len((self.U - self.L) | self.R)/len(self.U),
-            'PLOnR': len(self.L | (self.U - self.R))/len(self.U),
-            'PnLOnR': len((self.U - self.L) | (self.U - self.R))/len(self.U),
-        }
-
-        for key in values.keys():
-            values['P'+key] = percent(values[key])
-
-        self.statement = self.ptype['statement'].format(**values)
-
-        self.answer = self.ptype['answer'].format(**values)
-
-        self.solution = self.ptype['solution'].format(**values)
-
-class ThreeVarProb(Problem):
-    '''A three-variable probability problem.
-
-    This ought to be combined with TwoVarProb into an Nvar prob.
-    '''
+class ThreeVarProb(SurveyProb):
+    '''A three-variable probability problem.'''
     printable = True
     secname = 'Three Variable Probability'
+    sets = 'ABC'
     ptypes = (
         {'statement': r'''A survey of a group's viewing habits over the last
          year revealed the following information:
@@ -615,76 +671,10 @@ class ThreeVarProb(Problem):
          Then $P(G \cup B \cup S) = {PAOBOC}$ and $P(G' \cap B' \cap S') = 1 -
          {PAOBOC} = {PnAAnBAnC}$.
          ''',
-         'ltest':  lambda: True if random.gauss(.3, .3) > .5 else False,
-         'rtest':  lambda: True if random.gauss(.3, .3) > .5 else False,
+         'probs': (MEMBERSHIP, MEMBERSHIP, MEMBERSHIP),
         },
     )
 
-    def __init__(self, U=100):
-
-        self.ptype = random.choice(self.ptypes)
-
-        self.A = set()
-        self.B = set()
-        self.C = set()
-        self.U = set(xrange(U))
-        for entry in self.U:
-            for group in (self.A, self.B, self.C):
-                if self.ptype['rtest']():
-                    group.add(entry)
-
-        values = {
-            'PA': len(self.A)/len(self.U),
-            'PB': len(self.B)/len(self.U),
-            'PC': len(self.C)/len(self.U),
-            'PnA': len((self.U - self.A))/len(self.U),
-            'PnB': len((self.U - self.B))/len(self.U),
-            'PnC': len((self.U - self.C))/len(self.U),
-            'PAAB': len(self.A & self.B)/len(self.U),
-            'PAAC': len(self.A & self.C)/len(self.U),
-            'PAAnB': len(self.A & (self.U - self.B))/len(self.U),
-            'PAAnC': len(self.A & (self.U - self.C))/len(self.U),
-            'PBAC': len(self.B & self.C)/len(self.U),
-            'PBAnA': len(self.B & (self.U - self.A))/len(self.U),
-            'PBAnC': len(self.B & (self.U - self.C))/len(self.U),
-            'PCAnA': len(self.C & (self.U - self.A))/len(self.U),
-            'PCBnB': len(self.C & (self.U - self.B))/len(self.U),
-            'PAABAC': len(self.A & self.B & self.C)/len(self.U),
-            'PAABAnC': len(self.A & self.B & (self.U - self.C))/len(self.U),
-            'PAAnBAC': len(self.A & (self.U - self.B) & self.C)/len(self.U),
-            'PAAnBAnC': len(self.A & (self.U - self.B) & (self.U - self.C))/len(self.U),
-            'PnAABAC': len((self.U - self.A) & self.B & self.C)/len(self.U),
-            'PnAABAnC': len((self.U - self.A) & self.B & (self.U - self.C))/len(self.U),
-            'PnAAnBAC': len((self.U - self.A) & (self.U - self.B) & self.C)/len(self.U),
-            'PnAAnBAnC': len((self.U - self.A) & (self.U - self.B) & (self.U - self.C))/len(self.U),
-            'PAOB': len(self.A | self.B)/len(self.U),
-            'PAOC': len(self.A | self.C)/len(self.U),
-            'PAOnB': len(self.A | (self.U - self.B))/len(self.U),
-            'PAOnC': len(self.A | (self.U - self.C))/len(self.U),
-            'PBOC': len(self.B | self.C)/len(self.U),
-            'PBOnA': len(self.B | (self.U - self.A))/len(self.U),
-            'PBOnC': len(self.B | (self.U - self.C))/len(self.U),
-            'PCOnA': len(self.C | (self.U - self.A))/len(self.U),
-            'PCOnB': len(self.C | (self.U - self.B))/len(self.U),
-            'PAOBOC': len(self.A | self.B | self.C)/len(self.U),
-            'PAOBOnC': len(self.A | self.B | (self.U - self.C))/len(self.U),
-            'PAOnBOC': len(self.A | (self.U - self.B) | self.C)/len(self.U),
-            'PAOnBOnC': len(self.A | (self.U - self.B) | (self.U - self.C))/len(self.U),
-            'PnAABAC': len((self.U - self.A) & self.B & self.C)/len(self.U),
-            'PnAABAnC': len((self.U - self.A) & self.B & (self.U - self.C))/len(self.U),
-            'PnAAnBAC': len((self.U - self.A) & (self.U - self.B) & self.C)/len(self.U),
-            'PnAAnBAnC': len((self.U - self.A) & (self.U - self.B) & (self.U - self.C))/len(self.U),
-        }
-
-        for key in values.keys():
-            values['P'+key] = percent(values[key])
-
-        self.statement = self.ptype['statement'].format(**values)
-
-        self.answer = self.ptype['answer'].format(**values)
-
-        self.solution = self.ptype['solution'].format(**values)
-
 if __name__ == '__main__':
     # add something here!
     pass
@@ -0,0 +1,35 @@
+'''Draw problem parameters directly from their valid domains.
+
+Each function here draws uniformly from a constrained set of integers in a
+fixed number of steps: there is no drawing and redrawing until a value
+happens to fit, and no way to end up asking `randrange` for an empty range.
+Every function takes the `random.Random` to draw from first.
+'''
+
+
+def composition(rng, total, parts, minimum=0):
+    '''A random tuple of `parts` integers, each at least `minimum`, that add
+    up to `total`.
+
+    Every such tuple is equally likely: the tuple is read off a random
+    choice of where to put `parts - 1` bars among the units of `total`.
+    '''
+    spare = total - parts * minimum
+    if spare < 0:
+        raise ValueError('{} parts of at least {} add up to more than '
+                         '{}'.format(parts, minimum, total))
+    bars = sorted(rng.sample(xrange(spare + parts - 1), parts - 1))
+    edges = [-1] + bars + [spare + parts - 1]
+    return tuple(edges[i + 1] - edges[i] - 1 + minimum
+                 for i in xrange(parts))
+
+
+def bounded_composition(rng, total, parts, minimum=0):
+    '''A random tuple of `parts` integers, each at least `minimum`, that add
+    up to at most `total`.  Every such tuple is equally likely.'''
+    spare = total - parts * minimum
+    if spare < 0:
+        raise ValueError('{} parts of at least {} add up to more than '
+                         '{}'.format(parts, minimum, total))
+    return tuple(part + minimum
+                 for part in composition(rng, spare, parts + 1)[:parts])
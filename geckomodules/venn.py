@@ -0,0 +1,156 @@
+'''Region counts for Venn diagrams of any number of sets.
+
+Set membership is drawn as packed integer bitmasks, one bit per member, and
+the 2^N atomic regions of the diagram are counted once.  The share of any
+Boolean combination of the sets is then a sum over those regions, so it
+costs the same however many members there are, and nothing is computed for
+combinations that no template asks for.
+
+Combinations are written the way the probability templates name them: a
+term is a set name, optionally preceded by `n` for its complement, and terms
+are joined by `A` (and) or `O` (or), with `A` binding tighter.  `LAnR` is
+L and not R; `nAOBAC` is not A, or B and C.
+'''
+
+from __future__ import division
+
+import random
+import string
+
+
+def random_mask(nbits, prob, precision=32, rng=random):
+    '''A random `nbits`-bit integer with each bit set with probability `prob`.
+
+    The bits are drawn all at once: uniformly random words are folded
+    together with | and & following the binary expansion of `prob`, from
+    the least significant digit up.  That costs `precision` big-integer
+    operations, however many bits there are.
+    '''
+    digits = min(int(round(prob * 2**precision)), 2**precision - 1)
+    mask = 0
+    for _ in xrange(precision):
+        word = rng.getrandbits(nbits)
+        if digits & 1:
+            mask |= word
+        else:
+            mask &= word
+        digits >>= 1
+    return mask
+
+
+def popcount(mask):
+    '''The number of set bits in `mask`.'''
+    return bin(mask).count('1')
+
+
+def region_counts(masks, nbits):
+    '''Count the members of every region of the Venn diagram of `masks`.
+
+    Region r holds the members that are in set i exactly when bit i of r is
+    set, so e.g. region 0 is the members of none of the sets.
+    '''
+    regions = [(1 << nbits) - 1]
+    for mask in masks:
+        regions = ([region & ~mask for region in regions]
+                   + [region & mask for region in regions])
+    return [popcount(region) for region in regions]
+
+
+class Venn(object):
+    '''The region counts of a Venn diagram with one named set per letter.'''
+
+    def __init__(self, names, counts):
+        if len(counts) != 2**len(names):
+            raise ValueError('{} sets need {} region counts, not {}'.format(
+                len(names), 2**len(names), len(counts)))
+        self.names = names
+        self.counts = counts
+        self.total = sum(counts)
+        self._shares = {}
+
+    @classmethod
+    def sample(cls, names, probs, total, rng=random):
+        '''A diagram of `total` members, each of whom is in set i with
+        probability probs[i].'''
+        masks = [random_mask(total, prob, rng=rng) for prob in probs]
+        return cls(names, region_counts(masks, total))
+
+    def regions(self, expr):
+        '''The set of regions inside the combination `expr`.'''
+        regions = set()
+        for clause in self._parse(expr):
+            inside = set(xrange(len(self.counts)))
+            for bit, negated in clause:
+                inside = set(region for region in inside
+                             if bool(region & bit) != negated)
+            regions |= inside
+        return regions
+
+    def count(self, expr):
+        '''The number of members in the combination `expr`.'''
+        return sum(self.counts[region] for region in self.regions(expr))
+
+    def share(self, expr):
+        '''The proportion of members in the combination `expr`.'''
+        try:
+            return self._shares[expr]
+        except KeyError:
+            share = self._shares[expr] = self.count(expr) / self.total
+            return share
+
+    def values(self, percent):
+        '''A template mapping that fills in `P<expr>` with share(expr) and
+        `PP<expr>` with percent(share(expr)), on demand.'''
+        return VennValues(self, percent)
+
+    def _parse(self, expr):
+        '''Split `expr` into or-ed clauses of and-ed (bit, negated) terms.'''
+        clauses = [[]]
+        pos = 0
+        while True:
+            negated = expr.startswith('n', pos)
+            if negated:
+                pos += 1
+            if pos >= len(expr) or expr[pos] not in self.names:
+                raise ValueError('bad set expression {!r}'.format(expr))
+            clauses[-1].append((1 << self.names.index(expr[pos]), negated))
+            pos += 1
+
+            if pos == len(expr):
+                return clauses
+            elif expr[pos] == 'O':
+                clauses.append([])
+            elif expr[pos] != 'A':
+                raise ValueError('bad set expression {!r}'.format(expr))
+            pos += 1
+
+
+class VennValues(dict):
+    '''Template values computed from a `Venn` the first time they are used.
+
+    Use it with `format_template`; `str.format(**values)` would copy it
+    into a plain dict first and lose the missing-key lookup.
+    '''
+
+    def __init__(self, venn, percent):
+        super(VennValues, self).__init__()
+        self.venn = venn
+        self.percent = percent
+
+    def __missing__(self, key):
+        try:
+            if key.startswith('PP'):
+                value = self.percent(self.venn.share(key[2:]))
+            elif key.startswith('P'):
+                value = self.venn.share(key[1:])
+            else:
+                raise KeyError(key)
+        except ValueError:
+            raise KeyError(key)
+        self[key] = value
+        return value
+
+
+def format_template(template, values):
+    '''Fill in `template` like str.format, looking fields up in `values`.'''
+    return string.Formatter().vformat(template, (), values)
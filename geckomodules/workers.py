@@ -0,0 +1,61 @@
+'''Process pools whose workers start warm.
+
+A worker forked from a parent that has only imported geckomath still has to
+import sympy and the problem modules, and fill sympy's caches, before its
+first problem comes out, and every worker pays for that separately.
+`warm_pool` does that work once in the parent, by generating one problem of
+each type, and only then forks the workers, which share the parent's
+modules, caches and problem banks copy-on-write.
+
+    pool = workers.warm_pool(4)
+    pool.imap_unordered(...)
+
+Where processes can't be forked (Windows), each worker warms itself up as
+it starts instead.  `benchmarks/startup.py` compares the time to the first
+problem with and without warming up.
+'''
+
+import gc
+import logging
+import multiprocessing
+import os
+import time
+
+import bank
+import plugins
+
+# the types whose problems this process has already generated
+_warm = set()
+
+
+def warm_up(entries=None):
+    '''Generate and render one problem of each of the types `entries` (every
+    printable type by default) and open their banks, so that the modules
+    and caches they need are loaded.  Returns the time it took.'''
+    if entries is None:
+        entries = plugins.probtypes()
+    cold = [entry for entry in entries if entry not in _warm]
+    start = time.time()
+    probtypes = [entry.load() for entry in cold]
+    bank.load_banks(probtypes)
+    for probtype in probtypes:
+        for prob in probtype.draw_unique(1, 'warm-up'):
+            prob.statement, prob.answer, prob.solution
+    _warm.update(cold)
+    elapsed = time.time() - start
+    if cold:
+        logging.debug('warmed up %d problem types in %.2fs', len(cold),
+                      elapsed)
+    return elapsed
+
+
+def warm_pool(processes=None, entries=None):
+    '''A `multiprocessing.Pool` of `processes` workers, one per core by
+    default, that start with the types `entries` warmed up.'''
+    if not hasattr(os, 'fork'):
+        return multiprocessing.Pool(processes, warm_up, (entries,))
+    warm_up(entries)
+    # leave the workers as little garbage to collect, and so as few shared
+    # pages to copy, as possible
+    gc.collect()
+    return multiprocessing.Pool(processes)
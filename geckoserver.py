@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+'''Serve worksheets over HTTP from a pool of warm worker processes.
+
+Every request to geckomath.py pays for starting Python, importing sympy and
+registering the problem modules.  The server does all of that once, then
+forks its workers, so a request only pays for generating (and compiling)
+its worksheet.
+
+POST a worksheet spec to /worksheet.  The spec is a JSON object laid out
+like geckomath.ini: sections named after problem types with `nprobs` and
+`solutions`, and optionally `worksheet` (`seed`).  Types that aren't
+mentioned get no problems.  A `LaTeX` section (`preamble`, `postamble`) is
+handed straight to pdflatex, so it is only accepted when the server is
+started with --allow-latex.  A worksheet may have at most
+`--max-problems` problems in all, and a spec at most `MAX_SPEC_BYTES`.
+
+    {"AbsValProb": {"nprobs": 3, "solutions": true},
+     "worksheet": {"seed": 42}}
+
+The reply is a JSON object with the worksheet's `seed` and its `problems`
+and `solutions`: base64-encoded PDFs, or the TeX source with
+`/worksheet?format=tex`.  At most `--queue` worksheets are accepted at
+once; past that the server answers 503 with a Retry-After header until
+the backlog drains.  GET /status reports the load.
+
+    python geckoserver.py [--port 8000] [--jobs N] [--queue N]
+                          [--max-problems N] [--allow-latex]
+'''
+
+import argparse
+import BaseHTTPServer
+import base64
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import SocketServer
+import StringIO
+import tempfile
+import threading
+import urlparse
+
+from geckomodules import plugins, workers
+import geckomath
+
+FORMATS = ('pdf', 'tex')
+# the options clients may set in the sections that aren't problem types
+OPTIONS = {'worksheet': ('seed',), 'LaTeX': ('preamble', 'postamble')}
+# the most problems one worksheet may have, by default
+MAX_PROBLEMS = 200
+# the longest spec a client may post, in bytes
+MAX_SPEC_BYTES = 64 * 1024
+
+
+class SpecError(ValueError):
+    '''A worksheet spec that can't be turned into a config.'''
+
+
+def spec_config(spec, allow_latex=False, max_problems=MAX_PROBLEMS):
+    '''A geckomath config for the worksheet described by `spec`.  The
+    `LaTeX` section is refused unless `allow_latex` is set, and so is a
+    worksheet of more than `max_problems` problems.'''
+    if not isinstance(spec, dict):
+        raise SpecError('the worksheet spec must be a JSON object')
+
+    config = geckomath.new_config('problems.pdf', 'solutions.pdf')
+    for section, options in spec.items():
+        if section == 'output':
+            raise SpecError("the server picks the output paths")
+        if section == 'LaTeX' and not allow_latex:
+            raise SpecError('this server takes no custom LaTeX')
+        if not config.has_section(section) and section != 'worksheet':
+            raise SpecError('unknown section {!r}'.format(section))
+        if not isinstance(options, dict):
+            raise SpecError('section {!r} must be a JSON object'.format(
+                section))
+        if not config.has_section(section):
+            config.add_section(section)
+        for option, value in options.items():
+            if section in OPTIONS and option not in OPTIONS[section]:
+                raise SpecError("unknown option '{}' in section '{}'".format(
+                    option, section))
+            config.set(section, option, unicode(value).encode('utf-8'))
+
+    total = 0
+    try:
+        for probtype in plugins.probtypes():
+            nprobs = config.getint(probtype.name, 'nprobs')
+            config.getboolean(probtype.name, 'solutions')
+            if nprobs < 0:
+                raise SpecError("'nprobs' in section '{}' is negative".format(
+                    probtype.name))
+            total += nprobs
+    except ValueError as error:
+        raise SpecError(str(error))
+    if total > max_problems:
+        raise SpecError('a worksheet may have at most {} problems'.format(
+            max_problems))
+    return config
+
+
+def render(spec, output_format, allow_latex=False, max_problems=MAX_PROBLEMS):
+    '''Make the worksheet for `spec`; runs in a worker process.'''
+    config = spec_config(spec, allow_latex, max_problems)
+    seed = geckomath.worksheet_seed(config)
+
+    if output_format == 'tex':
+        probtex, solntex = StringIO.StringIO(), StringIO.StringIO()
+        geckomath.write_to_files(probtex, solntex, config, seed)
+        return {'seed': str(seed), 'problems': probtex.getvalue(),
+                'solutions': solntex.getvalue()}
+
+    workdir = tempfile.mkdtemp(prefix='geckoserver-')
+    try:
+        prob_path = os.path.join(workdir, 'problems.pdf')
+        soln_path = os.path.join(workdir, 'solutions.pdf')
+        geckomath.make_worksheet(config, prob_path, soln_path, seed)
+        reply = {'seed': str(seed)}
+        for name, path in (('problems', prob_path), ('solutions', soln_path)):
+            with open(path, 'rb') as pdf:
+                reply[name] = base64.b64encode(pdf.read())
+        return reply
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _render_job(spec, output_format, allow_latex, max_problems):
+    '''Pool worker: `render`, returning (reply, None), or (None, error
+    message) if it fails, so that every job ends with a result.'''
+    try:
+        return render(spec, output_format, allow_latex, max_problems), None
+    except Exception as error:
+        logging.exception('worksheet failed')
+        return None, str(error)
+
+
+class WorksheetServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''An HTTP server that hands worksheets to a process pool.
+
+    Each connection gets a thread that waits for its worksheet; `queue`
+    bounds how many worksheets are accepted (queued or being made) at once.
+    A worksheet keeps its place until its worker is done with it, even if
+    the request has already timed out.
+    '''
+    daemon_threads = True
+
+    def __init__(self, address, jobs=None, queue=None, timeout=300,
+                 allow_latex=False, max_problems=MAX_PROBLEMS):
+        BaseHTTPServer.HTTPServer.__init__(self, address, WorksheetHandler)
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.capacity = queue or 4 * self.jobs
+        self.timeout_seconds = timeout
+        self.allow_latex = allow_latex
+        self.max_problems = max_problems
+        self.pending = 0
+        self.served = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self.pool = workers.warm_pool(self.jobs)
+
+    def admit(self):
+        '''Reserve a place for a worksheet; False if the queue is full.'''
+        with self._lock:
+            if self.pending >= self.capacity:
+                self.rejected += 1
+                return False
+            self.pending += 1
+            return True
+
+    def release(self, result=None):
+        with self._lock:
+            self.pending -= 1
+            self.served += 1
+
+    def status(self):
+        with self._lock:
+            return {'jobs': self.jobs, 'capacity': self.capacity,
+                    'pending': self.pending, 'served': self.served,
+                    'rejected': self.rejected}
+
+    def server_close(self):
+        BaseHTTPServer.HTTPServer.server_close(self)
+        self.pool.terminate()
+        self.pool.join()
+
+
+class WorksheetHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if urlparse.urlparse(self.path).path == '/status':
+            self.send_json(200, self.server.status())
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlparse.urlparse(self.path)
+        if url.path != '/worksheet':
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        query = urlparse.parse_qs(url.query)
+        output_format = query.get('format', ['pdf'])[0]
+        if output_format not in FORMATS:
+            self.send_json(400, {'error': 'format must be one of {}'.format(
+                ', '.join(FORMATS))})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if not 0 <= length <= MAX_SPEC_BYTES:
+            # the body is left unread, so the connection can't be reused
+            self.close_connection = 1
+            if length < 0:
+                self.send_json(400, {'error': 'bad Content-Length'})
+            else:
+                self.send_json(413, {'error': 'the spec is over {} bytes'
+                                              .format(MAX_SPEC_BYTES)})
+            return
+        try:
+            spec = json.loads(self.rfile.read(length))
+            spec_config(spec, self.server.allow_latex,
+                        self.server.max_problems)
+        except ValueError as error:
+            self.send_json(400, {'error': str(error)})
+            return
+
+        if not self.server.admit():
+            self.send_json(503, {'error': 'too many worksheets queued'},
+                           {'Retry-After': '1'})
+            return
+        try:
+            # the place is given up when the worker finishes, not when this
+            # request gives up waiting for it
+            job = self.server.pool.apply_async(
+                _render_job, (spec, output_format, self.server.allow_latex,
+                              self.server.max_problems),
+                callback=self.server.release)
+        except Exception:
+            self.server.release()
+            raise
+        try:
+            reply, error = job.get(self.server.timeout_seconds)
+        except multiprocessing.TimeoutError:
+            self.send_json(504, {'error': 'the worksheet took too long'})
+            return
+        if error is not None:
+            self.send_json(500, {'error': error})
+        else:
+            self.send_json(200, reply)
+
+    def send_json(self, code, body, headers=None):
+        data = json.dumps(body)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug('%s - %s', self.address_string(), format % args)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-H', '--host', default='127.0.0.1',
+                        help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('-p', '--port', type=int, default=8000,
+                        help='port to listen on (default: 8000)')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('-q', '--queue', type=int,
+                        help='worksheets accepted at once (default: 4 a job)')
+    parser.add_argument('-m', '--max-problems', type=int,
+                        default=MAX_PROBLEMS,
+                        help='most problems on one worksheet (default: '
+                             '{})'.format(MAX_PROBLEMS))
+    parser.add_argument('--allow-latex', action='store_true',
+                        help='accept a LaTeX preamble and postamble from '
+                             'clients, which pdflatex runs as given')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.info('warming up')
+    server = WorksheetServer((args.host, args.port), args.jobs, args.queue,
+                             allow_latex=args.allow_latex,
+                             max_problems=args.max_problems)
+    logging.info('serving on http://%s:%d/ with %d jobs, queue of %d',
+                 args.host, args.port, server.jobs, server.capacity)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+'''Helpers for driving pdflatex.
+
+Everything here is about making the compile step cheaper: the shared
+preamble is dumped once into a precompiled format that later compiles load
+instead of re-reading the preamble, and finished PDFs are cached by the TeX
+that produced them so identical documents are never compiled twice.  The
+TeX of each section is cached as well, so that a worksheet with one section
+changed only regenerates that section.
+How long each kind of document took to compile is remembered too, so that
+a batch can start its longest compiles first.
+'''
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.geckomath')
+FORMAT_DIR = os.path.join(CACHE_DIR, 'formats')
+PDF_DIR = os.path.join(CACHE_DIR, 'pdfs')
+FRAGMENT_DIR = os.path.join(CACHE_DIR, 'fragments')
+TIMES_PATH = os.path.join(CACHE_DIR, 'compile_times.json')
+
+# the default bound on the size of the PDF cache, in bytes
+PDF_CACHE_SIZE = 256 * 1024 * 1024
+# and on the size of the TeX fragment cache
+FRAGMENT_CACHE_SIZE = 32 * 1024 * 1024
+
+BEGIN_DOCUMENT = r'\begin{document}'
+
+# name: the format name to hand to `pdflatex -fmt`
+# head: the part of the preamble that is baked into the format
+# env: the environment pdflatex needs to find the format
+Format = collections.namedtuple('Format', ['name', 'head', 'env'])
+
+_engine_version = None
+_formats = {}
+
+
+def engine_version():
+    '''The version banner of the installed pdflatex.'''
+    global _engine_version
+    if _engine_version is None:
+        latex_call = subprocess.Popen(('pdflatex', '--version'),
+                                      stdout=subprocess.PIPE)
+        texout, _ = latex_call.communicate()
+        lines = texout.splitlines()
+        _engine_version = lines[0] if lines else ''
+    return _engine_version
+
+
+def split_preamble(preamble):
+    '''Split a preamble into the part that can go into a format and the rest.
+
+    Everything before `\\begin{document}` can be dumped; the
+    `\\begin{document}` itself has to stay in the document.
+    '''
+    head, begin, tail = preamble.partition(BEGIN_DOCUMENT)
+    return head, begin + tail
+
+
+def _format_env():
+    # the trailing separator keeps pdflatex's default search path as well
+    return dict(os.environ, TEXFORMATS=FORMAT_DIR + os.pathsep)
+
+
+def preamble_format(preamble):
+    '''Return a `Format` with the given preamble preloaded.
+
+    The format is keyed by a hash of the preamble text and the engine
+    version, so it is built the first time a preamble is seen and rebuilt
+    whenever either of them changes.  Returns None if the format can't be
+    built, in which case callers should compile the full preamble.
+    '''
+    head, _ = split_preamble(preamble)
+    if head in _formats:
+        return _formats[head]
+
+    digest = hashlib.sha1('\0'.join([engine_version(), head])).hexdigest()
+    name = 'geckomath-{}'.format(digest[:16])
+    path = os.path.join(FORMAT_DIR, name + '.fmt')
+
+    if not os.path.exists(path):
+        try:
+            _build_format(name, head, path)
+        except (OSError, IOError) as error:
+            logging.warning('could not build a format for the preamble: %s',
+                            error)
+            return None
+
+    fmt = _formats[head] = Format(name, head, _format_env())
+    return fmt
+
+
+def _build_format(name, head, path):
+    '''Dump `head` into the format file at `path`.'''
+    logging.debug('building format %s', name)
+    if not os.path.isdir(FORMAT_DIR):
+        os.makedirs(FORMAT_DIR)
+
+    builddir = tempfile.mkdtemp(prefix='geckomath-', dir=FORMAT_DIR)
+    try:
+        with open(os.path.join(builddir, name + '.tex'), 'w') as texfile:
+            print >>texfile, head
+            print >>texfile, r'\dump'
+
+        latex_call = subprocess.Popen(
+            ('pdflatex', '-ini', '-interaction=batchmode', '-jobname', name,
+             '&pdflatex', name + '.tex'),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=builddir)
+        texout, _ = latex_call.communicate()
+        logging.debug('%s texout: \n %s', name, texout)
+
+        built = os.path.join(builddir, name + '.fmt')
+        if latex_call.returncode or not os.path.exists(built):
+            raise OSError('pdflatex -ini exited with status {}'.format(
+                latex_call.returncode))
+
+        try:
+            os.rename(built, path)
+        except OSError:
+            # another process may have won the race to build the same format
+            if not os.path.exists(path):
+                raise
+    finally:
+        shutil.rmtree(builddir, ignore_errors=True)
+
+
+class PDFCache(object):
+    '''An on-disk, size-bounded LRU cache of compiled PDFs.
+
+    PDFs are stored under a hash of the TeX source that produced them and the
+    pdflatex version.  Every hit refreshes the entry's modification time, and
+    when the cache grows past `max_bytes` the least recently used entries are
+    removed.  `hits` and `misses` count lookups since the cache was created.
+    '''
+
+    def __init__(self, directory=PDF_DIR, max_bytes=PDF_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def hasher():
+        '''A hash object that gives a cache key once fed the TeX source.
+
+        This lets a key be computed while the source is still being written.
+        '''
+        return hashlib.sha1(engine_version() + '\0')
+
+    @classmethod
+    def key(cls, tex):
+        '''The cache key for a TeX source.'''
+        hasher = cls.hasher()
+        hasher.update(tex)
+        return hasher.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pdf')
+
+    def fetch(self, key, pdf_path):
+        '''Copy the PDF cached under `key` to `pdf_path`.
+
+        Returns whether there was one.
+        '''
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, pdf_path)
+            os.utime(path, None)
+        except (OSError, IOError):
+            with self._lock:
+                self.misses += 1
+            return False
+
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, pdf_path):
+        '''Cache a copy of the PDF at `pdf_path` under `key`.'''
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        handle, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        os.close(handle)
+        try:
+            shutil.copyfile(pdf_path, tmp_path)
+            try:
+                os.rename(tmp_path, self._path(key))
+            except OSError:
+                # someone else cached the same PDF first
+                if not os.path.exists(self._path(key)):
+                    raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.evict()
+
+    def evict(self):
+        '''Remove least recently used PDFs until the cache fits.'''
+        _evict(self.directory, '.pdf', self.max_bytes)
+
+    def stats(self):
+        '''The hit and miss counts as a dictionary.'''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+def _evict(directory, suffix, max_bytes):
+    '''Remove the least recently used files ending in `suffix` from
+    `directory` until the rest add up to at most `max_bytes`.'''
+    entries = []
+    for filename in os.listdir(directory):
+        if not filename.endswith(suffix):
+            continue
+        path = os.path.join(directory, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+class FragmentCache(object):
+    '''A cache of the TeX each section of a worksheet renders to.
+
+    A fragment is the pair of TeX snippets one section adds to the problems
+    and the solutions; the caller picks the key (see
+    `geckomath.fragment_key`).  Fragments are kept in memory for a process
+    that rebuilds the same worksheet over and over, and on disk, bounded
+    and evicted like the PDF cache, for the next run.
+    '''
+
+    def __init__(self, directory=FRAGMENT_DIR, max_bytes=FRAGMENT_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.tex')
+
+    def fetch(self, key):
+        '''The (problems, solutions) fragment cached under `key`, or None.'''
+        with self._lock:
+            fragment = self._memory.get(key)
+        if fragment is None:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as cached:
+                    fragment = tuple(cached.read().split('\0', 1))
+                os.utime(path, None)
+            except (OSError, IOError):
+                fragment = None
+
+        with self._lock:
+            if fragment is None or len(fragment) != 2:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._memory[key] = fragment
+        return fragment
+
+    def store(self, key, probtex, solntex):
+        '''Cache the fragment of problems and solutions TeX under `key`.'''
+        with self._lock:
+            self._memory[key] = (probtex, solntex)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        handle, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as tmp:
+                tmp.write(probtex + '\0' + solntex)
+            os.rename(tmp_path, self._path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        _evict(self.directory, '.tex', self.max_bytes)
+
+    def stats(self):
+        '''The hit and miss counts as a dictionary.'''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+class CompileTimes(object):
+    '''How long compiles of each problem mix took on earlier runs.
+
+    A mix is a string naming what went into a document (see
+    `geckomath.compile_mix`).  The time kept for each mix is a running
+    average that favours recent compiles; `save()` writes the times out for
+    the next run.
+    '''
+
+    # the weight of the newest compile in the running average
+    WEIGHT = 0.3
+
+    def __init__(self, path=TIMES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as times:
+                self._seconds = json.load(times)
+        except (IOError, ValueError):
+            self._seconds = {}
+
+    def estimate(self, mix):
+        '''The expected seconds to compile `mix`, or None if unknown.'''
+        with self._lock:
+            return self._seconds.get(mix)
+
+    def record(self, mix, seconds):
+        with self._lock:
+            old = self._seconds.get(mix)
+            if old is not None:
+                seconds = old + self.WEIGHT * (seconds - old)
+            self._seconds[mix] = seconds
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with self._lock:
+            data = json.dumps(self._seconds, indent=1, sort_keys=True)
+
+        handle, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(handle, 'w') as tmp:
+                tmp.write(data)
+            os.rename(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+pdf_cache = PDFCache()
+fragment_cache = FragmentCache()
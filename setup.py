@@ -1,15 +1,16 @@
 from distutils.core import setup
-import os
 import py2exe
 
+from geckomodules import plugins
+
 dll_excludes=['w9xpopen.exe']
 
-# gather all of the geckomodules
-geckomodules = os.listdir('geckomodules')
-geckomodules = [file for file in geckomodules
-                if file.endswith('.py') and file != '__init__.py']
-geckomodules = ['geckomodules.{}'.format(os.path.splitext(module)[0]) 
-                for module in geckomodules]
+# the problem modules are only imported by name, so py2exe can't find them
+# on its own; the manifest lists them, and ships with the build
+manifest = plugins.write_manifest()
+geckomodules = sorted(set(probtype.module for probtype in manifest))
+# nor sympy, which lazyimport only imports when a problem first needs it
+includes = ['sympy']
 
 setup(
     name='Geckomath',
@@ -18,12 +19,14 @@ setup(
     author='John Dougherty',
     author_email='john.e.dougherty.ii@gmail.com',
     packages=['geckomodules'],
+    data_files=[('geckomodules', ['geckomodules/plugins.json'])],
     options = {
         'py2exe': {
             'ascii': False, 
             'bundle_files': 1, 
             'compressed': 2, 
             'dll_excludes': dll_excludes, 
+            'includes': includes,
             'optimize': 2, 
             'packages': ['geckomodules'] + geckomodules,
             'xref': False, 